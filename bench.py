@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+
+"""
+PyCDAWG 0.0.0
+Copyright (C) 2011 by Tai Chi Minh Ralph Eastwood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Micro-benchmarks for PyCDAWG.
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+
+from cdawg import cdawg, concurrentcdawg
+from shardedcdawg import shardedcdawg
+from slidingcdawg import slidingcdawg
+
+def random_keys(n, length, sigma, seed=0):
+    # n distinct random keys of the given length over an alphabet of sigma
+    # symbols.
+    rnd = random.Random(seed)
+    alphabet = [chr(32 + c) for c in range(sigma)]
+    keys = set()
+    while len(keys) < n:
+        keys.add(''.join(rnd.choice(alphabet) for _ in range(length)))
+    keys = sorted(keys)
+    rnd.shuffle(keys)
+    return keys
+
+def bench_lookup(sigma, n=2000, length=16, repeat=5):
+    # Seconds per lookup of a stored key.
+    keys = random_keys(n, length, sigma)
+    c = cdawg()
+    for (j, key) in enumerate(keys):
+        c[key] = j
+    def lookup():
+        for key in keys:
+            c[key]
+    return min(timeit.repeat(lookup, number=1, repeat=repeat)) / n
+
+def bench_build(n, length=16, sigma=16):
+    # Seconds per text symbol to bulk load n keys.
+    keys = random_keys(n, length, sigma)
+    pairs = [(key, j) for (j, key) in enumerate(keys)]
+    t = min(timeit.repeat(lambda: cdawg.from_iterable(pairs), number=1,
+                          repeat=3))
+    return t / (n * (length + 2))
+
+def bench_batch(n=20000, batch=1000, length=16, sigma=4, skew=False,
+                repeat=5):
+    # Seconds per key for single lookups, single lookups through LRU and
+    # LFU caches of 1000 keys and get_many over a batch of stored keys, drawn
+    # uniformly or with a Pareto skew.
+    keys = random_keys(n, length, sigma)
+    c = cdawg.from_iterable((key, j) for (j, key) in enumerate(keys))
+    cached = []
+    for policy in ('lru', 'lfu'):
+        d = cdawg(cache_size=1000, policy=policy)
+        d.update((key, j) for (j, key) in enumerate(keys))
+        cached.append(d)
+    rnd = random.Random(1)
+    if skew:
+        keys = [keys[min(int(rnd.paretovariate(1.0)), n) - 1]
+                for _ in range(batch)]
+    else:
+        keys = rnd.sample(keys, batch)
+    def single(c):
+        for key in keys:
+            c[key]
+    t = [min(timeit.repeat(f, number=1, repeat=repeat)) / batch
+         for f in (lambda: single(c), lambda: c.get_many(keys),
+                   lambda: single(cached[0]), lambda: single(cached[1]))]
+    try:
+        import numpy
+    except ImportError:
+        return t
+    a = numpy.array(keys)
+    return t + [min(timeit.repeat(lambda: c.get_many(a), number=1,
+                                  repeat=repeat)) / batch]
+
+def traced(f):
+    # The result of f, the bytes it leaves allocated and the peak bytes
+    # allocated while it ran.
+    tracemalloc.start()
+    try:
+        r = f()
+        (size, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (r, size, peak)
+
+def bench_freeze(n=20000, length=16, sigma=16, repeat=5):
+    # Seconds per lookup and bytes for a cdawg and its frozen copy.
+    keys = random_keys(n, length, sigma)
+    (c, csize, peak) = traced(lambda: cdawg.from_iterable(
+        (key, j) for (j, key) in enumerate(keys)))
+    (f, fsize, peak) = traced(c.freeze)
+    def lookup(d):
+        for key in keys:
+            d[key]
+    t = [min(timeit.repeat(lambda: lookup(d), number=1, repeat=repeat)) / n
+         for d in (c, f)]
+    return [(t[0], csize), (t[1], fsize)]
+
+# Corpora for the suite: random text over an alphabet of sigma symbols,
+# highly repetitive DNA-like text and natural language-like words.
+
+def random_text(n, sigma, seed=0):
+    rnd = random.Random(seed)
+    alphabet = [chr(32 + c) for c in range(sigma)]
+    return ''.join(rnd.choice(alphabet) for _ in range(n))
+
+def dna_text(n, seed=0):
+    # Copies of earlier stretches of the text with 1% point mutations.
+    rnd = random.Random(seed)
+    text = [rnd.choice('ACGT') for _ in range(64)]
+    while len(text) < n:
+        start = rnd.randrange(len(text))
+        for c in text[start:start + rnd.randint(16, 256)]:
+            text.append(rnd.choice('ACGT') if rnd.random() < 0.01 else c)
+    return ''.join(text[:n])
+
+def words(n, seed=0):
+    # n distinct words of one to four syllables, drawn with a Zipf-like skew
+    # towards the common syllables.
+    rnd = random.Random(seed)
+    syllables = [a + b + c for a in 'tnsrlmdkpbg' for b in 'aeiou'
+                 for c in ('', 'n', 'r', 's', 't')]
+    rnd.shuffle(syllables)
+    weights = [1.0 / (r + 1) for r in range(len(syllables))]
+    result = set()
+    while len(result) < n:
+        result.add(''.join(rnd.choices(syllables, weights,
+                                       k=rnd.randint(1, 4))))
+    result = sorted(result)
+    rnd.shuffle(result)
+    return result
+
+def corpus(name, n):
+    # n keys of the named corpus and a text of about as many symbols.
+    if name == 'random':
+        return (random_keys(n, 16, 16), random_text(16 * n, 16))
+    if name == 'dna':
+        text = dna_text(32 * n)
+        keys = set()
+        p = 0
+        while len(keys) < n:
+            keys.add(text[p:p + 32])
+            p = (p + 29) % (len(text) - 32)
+        return (sorted(keys), text)
+    keys = words(n)
+    return (keys, ' '.join(keys))
+
+def bench_feed(n=1 << 18, window=4096, repeat=3):
+    # MB/s taken in by a windowed slidingcdawg one add at a time, through
+    # feed and through feed_file, over n bytes of DNA-like text.
+    text = dna_text(n)
+    with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as f:
+        f.write(text.encode('latin-1'))
+    def add():
+        sc = slidingcdawg(window=window)
+        for c in text:
+            sc.add(c)
+    try:
+        t = [min(timeit.repeat(f, number=1, repeat=repeat))
+             for f in (add, lambda: slidingcdawg(window=window).feed(text),
+                       lambda: slidingcdawg(window=window).feed_file(f.name))]
+    finally:
+        os.remove(f.name)
+    return [n / s / 1e6 for s in t]
+
+def edits(key, alphabet):
+    # The strings one deletion, substitution or insertion away from key.
+    splits = [(key[:i], key[i:]) for i in range(len(key) + 1)]
+    return set([a + b[1:] for (a, b) in splits if b] +
+               [a + x + b[1:] for (a, b) in splits if b for x in alphabet] +
+               [a + x + b for (a, b) in splits for x in alphabet])
+
+def bench_fuzzy(n=20000, queries=20, dist=2):
+    # Seconds per query within dist edits of a word with one letter
+    # changed, for search_fuzzy and for looking up every variant of the
+    # query.
+    keys = words(n)
+    c = cdawg.from_iterable((key, j) for (j, key) in enumerate(keys))
+    alphabet = sorted(set(''.join(keys)))
+    rnd = random.Random(1)
+    qs = []
+    for key in rnd.sample(keys, queries):
+        i = rnd.randrange(len(key))
+        qs.append(key[:i] + rnd.choice(alphabet) + key[i + 1:])
+    def fuzzy():
+        for q in qs:
+            list(c.search_fuzzy(q, dist))
+    def variants():
+        for q in qs:
+            near = set([q])
+            for _ in range(dist):
+                near |= set().union(*[edits(v, alphabet) for v in near])
+            [c[v] for v in near]
+    return [min(timeit.repeat(f, number=1, repeat=3)) / queries
+            for f in (fuzzy, variants)]
+
+def bench_scan(n=5000, length=2000, repeat=3):
+    # Seconds per character to find every occurrence of n words in a text
+    # of length of them, with scan and with a lookup of every window up to
+    # the longest word.
+    keys = words(n)
+    c = cdawg.from_iterable((key, j) for (j, key) in enumerate(keys))
+    rnd = random.Random(1)
+    text = ' '.join(rnd.choice(keys) for _ in range(length))
+    longest = max(map(len, keys))
+    def windows():
+        for i in range(len(text)):
+            for j in range(i + 1, min(i + longest, len(text)) + 1):
+                text[i:j] in c
+    return [min(timeit.repeat(f, number=1, repeat=repeat)) / len(text)
+            for f in (lambda: list(c.scan(text)), windows)]
+
+def bench_matching(n=5000, length=200, repeat=3):
+    # Seconds per character of the matching statistics of a text of length
+    # words against n others, in one pass and by growing a lookup at every
+    # position.
+    keys = words(n)
+    c = cdawg.from_iterable((key, j) for (j, key) in enumerate(keys))
+    rnd = random.Random(1)
+    text = ' '.join(rnd.choice(words(n, seed=2)) for _ in range(length))
+    def grow():
+        for i in range(len(text)):
+            j = i
+            while j < len(text) and c.has_substring(text[i:j + 1]):
+                j += 1
+    return [min(timeit.repeat(f, number=1, repeat=repeat)) / len(text)
+            for f in (lambda: c.matching_statistics(text), grow)]
+
+def bench_packed(n=1 << 17, keys=16):
+    # Seconds per symbol to build and bytes of text for DNA-like keys with an
+    # array('i') text and packed over ACGT.
+    text = dna_text(n)
+    step = n // keys
+    pairs = [(text[k:k + step], k) for k in range(0, n, step)]
+    result = []
+    for alphabet in (None, 'ACGT'):
+        start = time.perf_counter()
+        c = cdawg.from_iterable(pairs, alphabet)
+        result.append(((time.perf_counter() - start) / n,
+                       sys.getsizeof(c.w)))
+    return result
+
+def bench_sharded(workers, n=40000, length=16, sigma=16):
+    # Seconds to build n keys into as many shards as workers processes.
+    keys = random_keys(n, length, sigma)
+    pairs = [(key, j) for (j, key) in enumerate(keys)]
+    path = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        shardedcdawg.build(pairs, path, shards=workers, workers=workers)
+        return time.perf_counter() - start
+    finally:
+        shutil.rmtree(path)
+
+def stress(readers=4, n=20000, batch=100, seconds=None):
+    # Run readers threads against one writer inserting n keys into a
+    # concurrentcdawg, in batches of batch, while the interpreter switches
+    # threads as often as it can.  Every key maps to its own length and
+    # position, so a reader sees either no value or the right one; returns
+    # the reads made and the wrong values or errors seen.
+    keys = random_keys(n, 16, 4)
+    value = dict((key, (len(key), j)) for (j, key) in enumerate(keys))
+    c = concurrentcdawg()
+    done = threading.Event()
+    lock = threading.Lock()
+    result = {'reads': 0, 'errors': []}
+    def read(seed):
+        rnd = random.Random(seed)
+        reads = 0
+        errors = []
+        while not done.is_set():
+            batch_keys = rnd.sample(keys, 8)
+            try:
+                found = [c[key] for key in batch_keys[:4]]
+                found += c.get_many(batch_keys[4:])
+                for (key, v) in zip(batch_keys, found):
+                    if v != None and v != value[key]:
+                        errors.append((key, v))
+                    if v != None and not c.has_substring(key):
+                        errors.append((key, 'has_substring'))
+            except Exception as e:
+                errors.append(repr(e))
+            reads += len(batch_keys)
+        with lock:
+            result['reads'] += reads
+            result['errors'] += errors
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=read, args=(j,))
+                   for j in range(readers)]
+        for t in threads:
+            t.start()
+        deadline = None if seconds == None else time.time() + seconds
+        for k in range(0, n, batch):
+            c.update((key, value[key]) for key in keys[k:k + batch])
+            if deadline != None and time.time() > deadline:
+                break
+        done.set()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    for key in keys[:k + batch]:
+        if c[key] != value[key]:
+            result['errors'].append((key, c[key]))
+    return result
+
+def sliding_shape(sc):
+    # The edges and suffix links of a slidingcdawg with every node named by
+    # the longest string reaching it, the sink by '$', to compare graphs
+    # built in different ways.
+    edges = [e for e in sc.to_edgelist()[1:] if e[2] != None]
+    links = [e for e in sc.to_edgelist() if e[2] == None]
+    name = {'source': ''}
+    changed = True
+    while changed:
+        changed = False
+        for (a, b, label) in edges:
+            if b != 'sink' and a in name and \
+               len(name[a] + label) > len(name.get(b, '')):
+                name[b] = name[a] + label
+                changed = True
+    name['sink'] = '$'
+    return (sorted((name[a], label, name[b]) for (a, b, label) in edges),
+            sorted((name[a], name.get(b)) for (a, b, label) in links))
+
+def occurrences(text, s):
+    return sum(text.startswith(s, q) for q in range(len(text) - len(s) + 1))
+
+def check_window(trials=300, seed=0):
+    # Feed random text through slidingcdawgs with small windows, deleting
+    # now and then, and after every step compare the graph with one built
+    # from the window alone and the queries with brute force over it;
+    # returns the failures as (text fed, window, message).
+    rnd = random.Random(seed)
+    failures = []
+    for trial in range(trials):
+        alphabet = rnd.choice(['a', 'ab', 'aab', 'abc', 'abcd'])
+        window = rnd.choice([None, 1, 2, 3, 5, 8, 13, 21])
+        text = ''.join(rnd.choice(alphabet)
+                       for j in range(rnd.randint(1, 60)))
+        sc = slidingcdawg(window=window)
+        fed = ''
+        for c in text:
+            sc.add(c)
+            fed += c
+            if rnd.random() < 0.1:
+                sc.delete()
+            t = ''.join(sc.w[q % sc.n] for q in range(sc.b, sc.i))
+            fresh = sliding_build(t)
+            if sliding_shape(sc) != sliding_shape(fresh):
+                failures.append((fed, window, 'graph'))
+                break
+            subs = set(t[a:b] for a in range(len(t))
+                       for b in range(a + 1, len(t) + 1))
+            repeats = [s for s in subs if occurrences(t, s) > 1]
+            if any(sc.count(s) != occurrences(t, s) for s in subs):
+                failures.append((fed, window, 'count'))
+                break
+            if len(sc.longest_repeat()) != max(map(len, repeats), default=0):
+                failures.append((fed, window, 'longest_repeat'))
+                break
+            top = sc.top_k_repeats(5)
+            if any(occurrences(t, s) != n for (s, n) in top) or \
+               [n for (s, n) in top] != [n for (s, n) in fresh.top_k_repeats(5)]:
+                failures.append((fed, window, 'top_k_repeats'))
+                break
+    return failures
+
+def percentiles(samples):
+    s = sorted(samples)
+    return dict(('p%d' % q, s[min(len(s) - 1, len(s) * q // 100)] * 1e6)
+                for q in (50, 90, 99))
+
+def latencies(f, queries):
+    # The seconds taken by each call of f on queries.
+    clock = time.perf_counter
+    t = []
+    for q in queries:
+        start = clock()
+        f(q)
+        t.append(clock() - start)
+    return t
+
+def queries(keys, n=2000, seed=1):
+    # Stored keys and as many misses made by changing their last symbol.
+    rnd = random.Random(seed)
+    hits = rnd.sample(keys, min(n // 2, len(keys)))
+    return hits + [key[:-1] + chr(ord(key[-1]) + 1) for key in hits]
+
+def sliding_size(sc):
+    # Nodes and edges reachable from the source of a slidingcdawg.
+    seen = set([sc.source])
+    stack = [sc.source]
+    edges = 0
+    while stack:
+        n = stack.pop()
+        edges += len(n.to)
+        for ((k, p), n1) in n.to.values():
+            if n1 not in seen:
+                seen.add(n1)
+                stack.append(n1)
+    return (len(seen), edges)
+
+def sliding_build(text):
+    sc = slidingcdawg()
+    for c in text:
+        sc.add(c)
+    return sc
+
+def suite(scale=1.0, repeat=3):
+    # Build throughput, lookup latency percentiles, graph size and peak
+    # memory of cdawg and slidingcdawg over every corpus.
+    results = []
+    for name in ('random', 'dna', 'words'):
+        (keys, text) = corpus(name, int(20000 * scale))
+        pairs = [(key, j) for (j, key) in enumerate(keys)]
+        chars = sum(len(key) for key in keys)
+        t = min(timeit.repeat(lambda: cdawg.from_iterable(pairs), number=1,
+                              repeat=repeat))
+        (c, size, peak) = traced(lambda: cdawg.from_iterable(pairs))
+        results.append({'structure': 'cdawg', 'corpus': name,
+                        'keys': len(keys), 'chars': chars,
+                        'build_chars_per_s': chars / t,
+                        'lookup_us': percentiles(latencies(c.__getitem__,
+                                                           queries(keys))),
+                        'nodes': len(c.len), 'edges': len(c.et),
+                        'peak_kb': peak // 1024})
+        text = text[:int(20000 * scale)]
+        t = min(timeit.repeat(lambda: sliding_build(text), number=1,
+                              repeat=repeat))
+        (sc, size, peak) = traced(lambda: sliding_build(text))
+        rnd = random.Random(2)
+        subs = []
+        for _ in range(2000):
+            p = rnd.randrange(len(text) - 8)
+            subs.append(text[p:p + 8])
+        (nodes, edges) = sliding_size(sc)
+        results.append({'structure': 'slidingcdawg', 'corpus': name,
+                        'keys': 0, 'chars': len(text),
+                        'build_chars_per_s': len(text) / t,
+                        'lookup_us': percentiles(latencies(sc.__getitem__,
+                                                           subs)),
+                        'nodes': nodes, 'edges': edges,
+                        'peak_kb': peak // 1024})
+    return results
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def report(results, base=None):
+    # Print the suite results, with the ratio to a previous run where it
+    # has the same structure and corpus.
+    old = {}
+    for r in (base or {}).get('results', []):
+        old[(r['structure'], r['corpus'])] = r
+    print('%-12s %-7s %11s %9s %9s %9s %8s %8s %9s' % (
+        'structure', 'corpus', 'chars/s', 'p50 us', 'p90 us', 'p99 us',
+        'nodes', 'edges', 'peak KB'))
+    for r in results:
+        l = r['lookup_us']
+        print('%-12s %-7s %11.0f %9.2f %9.2f %9.2f %8d %8d %9d' % (
+            r['structure'], r['corpus'], r['build_chars_per_s'], l['p50'],
+            l['p90'], l['p99'], r['nodes'], r['edges'], r['peak_kb']))
+        o = old.get((r['structure'], r['corpus']))
+        if o:
+            ratio = lambda a, b: a / b if b else float('nan')
+            m = o['lookup_us']
+            print('%-12s %-7s %10.2fx %8.2fx %8.2fx %8.2fx %7.2fx %7.2fx '
+                  '%8.2fx' % ('', 'vs base',
+                  ratio(r['build_chars_per_s'], o['build_chars_per_s']),
+                  ratio(l['p50'], m['p50']), ratio(l['p90'], m['p90']),
+                  ratio(l['p99'], m['p99']), ratio(r['nodes'], o['nodes']),
+                  ratio(r['edges'], o['edges']),
+                  ratio(r['peak_kb'], o['peak_kb'])))
+
+def tables():
+    print('lookup of %d-symbol keys' % 16)
+    print('%8s %12s' % ('sigma', 'us/lookup'))
+    for sigma in (2, 4, 16, 64, 128, 200):
+        print('%8d %12.2f' % (sigma, bench_lookup(sigma) * 1e6))
+    print()
+    print('bulk load of %d-symbol keys' % 16)
+    print('%8s %12s' % ('keys', 'us/symbol'))
+    for n in (1000, 4000, 16000, 64000):
+        print('%8d %12.2f' % (n, bench_build(n) * 1e6))
+    print()
+    print('batches of %d lookups' % 1000)
+    print('%8s %12s %12s' % ('', 'us/key', 'skewed'))
+    for (name, t, u) in zip(('single', 'get_many', 'lru', 'lfu', 'numpy'),
+                            bench_batch(),
+                            bench_batch(skew=True)):
+        print('%8s %12.2f %12.2f' % (name, t * 1e6, u * 1e6))
+    print()
+    print('mutable and frozen, %d keys' % 20000)
+    print('%8s %12s %12s' % ('', 'us/lookup', 'KB'))
+    for (name, (t, size)) in zip(('cdawg', 'frozen'), bench_freeze()):
+        print('%8s %12.2f %12d' % (name, t * 1e6, size // 1024))
+    print()
+    print('text of %d DNA-like symbols' % (1 << 17))
+    print('%8s %12s %12s' % ('', 'us/symbol', 'KB'))
+    for (name, (t, size)) in zip(('array', 'packed'), bench_packed()):
+        print('%8s %12.2f %12d' % (name, t * 1e6, size // 1024))
+    print()
+    print('search within %d edits, %d words' % (2, 20000))
+    print('%9s %12s' % ('', 'ms/query'))
+    for (name, t) in zip(('fuzzy', 'variants'), bench_fuzzy()):
+        print('%9s %12.2f' % (name, t * 1e3))
+    print()
+    print('occurrences of %d words in a text of %d' % (5000, 2000))
+    print('%9s %12s' % ('', 'us/char'))
+    for (name, t) in zip(('scan', 'windows'), bench_scan()):
+        print('%9s %12.2f' % (name, t * 1e6))
+    print()
+    print('matching statistics of a text of %d words' % 200)
+    print('%9s %12s' % ('', 'us/char'))
+    for (name, t) in zip(('suffix', 'lookups'), bench_matching()):
+        print('%9s %12.2f' % (name, t * 1e6))
+    print()
+    print('slidingcdawg over a window of %d, %d KB' % (4096, 256))
+    print('%9s %12s' % ('', 'MB/s'))
+    for (name, r) in zip(('add', 'feed', 'feed_file'), bench_feed()):
+        print('%9s %12.3f' % (name, r))
+    print()
+    print('sharded build of %d keys, %d CPUs' % (40000, os.cpu_count() or 1))
+    print('%8s %12s %12s' % ('workers', 's', 'speedup'))
+    one = None
+    for workers in (1, 2, 4, 8):
+        t = bench_sharded(workers)
+        one = one or t
+        print('%8d %12.2f %12.2f' % (workers, t, one / t))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for PyCDAWG.')
+    parser.add_argument('--suite', action='store_true',
+                        help='run the construction, lookup and memory suite '
+                             'instead of the micro-benchmarks')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='scale the corpora of the suite')
+    parser.add_argument('--json', metavar='PATH',
+                        help='save the suite results to PATH')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='compare the suite to results saved earlier')
+    parser.add_argument('--stress', metavar='READERS', type=int,
+                        help='run READERS reader threads against one writer '
+                             'on a concurrentcdawg and check every read')
+    parser.add_argument('--check', metavar='TRIALS', type=int,
+                        help='check slidingcdawg against brute force over '
+                             'TRIALS random texts and windows')
+    args = parser.parse_args()
+    if args.check:
+        failures = check_window(args.check)
+        print('%d trials, %d failures' % (args.check, len(failures)))
+        for f in failures[:10]:
+            print(f)
+        sys.exit(1 if failures else 0)
+    if args.stress:
+        result = stress(args.stress)
+        print('%d reads, %d errors' % (result['reads'],
+                                       len(result['errors'])))
+        for e in result['errors'][:10]:
+            print(e)
+        sys.exit(1 if result['errors'] else 0)
+    if not args.suite:
+        tables()
+        sys.exit()
+    results = suite(args.scale)
+    base = None
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+    report(results, base)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'commit': commit(), 'python': platform.python_version(),
+                       'scale': args.scale, 'results': results}, f, indent=2)
@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 """
 PyCDAWG 0.0.0
@@ -22,271 +22,2141 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
+import io
+import mmap as _mmap
+import pickle
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
 
-from copy import copy
+# Symbols of the text.  Keys are spelled in code points (str keys) or byte
+# values (bytes keys), so negative symbols lie outside the alphabet: every key
+# is preceded by the start marker START and followed by its own terminator,
+# -2 - j for key number j.  A key is thus the string between the end of the
+# previous key plus one and its terminator, and spelling the start marker
+# first leaves a single terminator edge at the end of a whole key.
+START = -1
+# Native order UTF-32, which maps code points to int symbols and back in C.
+UTF32 = 'utf-32-le' if sys.byteorder == 'little' else 'utf-32-be'
 
-# Node class.
-class node:
+# File format written by cdawg.save.  A header of magic, byte order mark,
+# whether the keys are bytes, the counts (internal nodes, keys, edges,
+# terminator edges, text), the active point and the size of the value blob,
+# followed by the sections of _layout, each a flat native array padded to 8
+# bytes.  The sections up to e are the frozen layout described at
+# frozencdawg; len and suf are only needed to rebuild a cdawg that can be
+# extended.
+MAGIC = b'PyCDAWG\x03'
+HEADER = struct.Struct('=8sII8q')
 
-    sid_count = 0
+def _layout(binary, nodes, keys, edges, terms, text, values):
+    size = 1 if binary else 4
+    return [('w', 'B', size * text), ('fs', 'B', size * edges),
+            ('root', 'i', 3), ('off', 'i', nodes + 1), ('ek', 'i', edges),
+            ('ep', 'i', edges), ('et', 'i', edges), ('toff', 'i', nodes + 1),
+            ('tkey', 'i', terms), ('e', 'i', keys),
+            ('len', 'i', nodes + keys), ('suf', 'i', nodes + keys),
+            ('voff', 'q', keys + 1), ('values', 'B', values)]
 
-    def __init__(self, id='', n=None):
-        if n != None and isinstance(n, node):
-            self.len = n.len
-            self.suf = n.suf
-            self.to = copy(n.to)
+def _sections(buf):
+    # Return the header fields of buf and a memoryview of each section.
+    h = HEADER.unpack_from(buf)
+    if h[0] != MAGIC:
+        raise ValueError('not a cdawg file')
+    if h[1] != 0x01020304:
+        raise ValueError('cdawg file has foreign byte order')
+    view = memoryview(buf)
+    pos = HEADER.size
+    s = {}
+    for (name, typecode, count) in _layout(*h[2:8] + h[10:]):
+        pos = (pos + 7) & ~7
+        size = array(typecode).itemsize * count
+        s[name] = view[pos:pos + size].cast(typecode)
+        pos += size
+    return (h, s)
+
+# View the bytes of a saved text as its symbols.
+def _symbols(b, binary):
+    b = memoryview(b).cast('B')
+    return b if binary else b.cast('i')
+
+# Replace the terminators and start markers of a label with something more
+# readable.
+def _label(l):
+    label = ''
+    for c in l:
+        if c == START:
+            label += '^'
+        elif c >= 0:
+            label += chr(c)
+        else:
+            ucn = -2 - c
+            ln = ''
+            while True:
+                ln = chr(0x2080 + (ucn % 10)) + ln
+                ucn //= 10
+                if ucn == 0:
+                    break
+            label += '$' + ln
+    return label
+
+def _quote(s):
+    return '"' + s.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n') + '"'
+
+# Export of the graphs of cdawg and slidingcdawg, given as (from, to, label)
+# edges with label None for a suffix link.
+def write_dot(stream, edges):
+    # Write the edges as a DOT digraph, line by line.
+    stream.write('digraph {\n\tgraph [fontname="Sans 12"];\n'
+                 '\tnode [fontname="Sans 12"];\n'
+                 '\tedge [fontname="Sans 12"];\n')
+    for (u, v, l) in edges:
+        if l == None:
+            stream.write('\t%s -> %s [style=dashed];\n' % (_quote(u),
+                                                           _quote(v)))
         else:
-            self.len = 0
-            self.suf = None
-            self.to = {}
-        if id != '':
-            self.id = id
+            stream.write('\t%s -> %s [label=%s];\n' % (_quote(u), _quote(v),
+                                                       _quote(l)))
+    stream.write('}\n')
+
+def export_networkx(edges):
+    import networkx
+
+    graph = networkx.MultiDiGraph()
+    for (u, v, l) in edges:
+        if l == None:
+            graph.add_edge(u, v, style='dashed')
         else:
-            self.id = 's' + str(node.sid_count)
-            node.sid_count += 1
+            graph.add_edge(u, v, label=l)
+    return graph
+
+def draw(edges, outfile):
+    # Lay the edges out with dot and draw them to outfile; pygraphviz is
+    # only needed here.
+    import pygraphviz
+
+    dot = io.StringIO()
+    write_dot(dot, edges)
+    graph = pygraphviz.AGraph(string=dot.getvalue())
+    graph.layout(prog='dot')
+    graph.draw(outfile)
+
+# Lazily unpickled values of a mapped file.
+class _pickled:
+    def __init__(self, voff, blob):
+        self.voff = voff
+        self.blob = blob
+
+    def __getitem__(self, j):
+        return pickle.loads(self.blob[self.voff[j]:self.voff[j + 1]])
+
+# Profiling of a cdawg made with stats=True.  The counters are
+STATS = ('inserts', 'lookups', 'build_edges', 'query_edges', 'canonize_steps',
+         'splits', 'redirects', 'duplications', 'suffix_links')
+# and build and query latencies are kept in histograms of BUCKETS power of two
+# buckets of microseconds.
+BUCKETS = 32
+
+# Edge hash class
+#
+# The edge table of a cdawg, mapping the key c << 32 | s of the c-edge out of
+# node s to its edge id with open addressing and linear probing.  Keys are
+# kept in an array('q') and ids in an array('i'), twelve bytes a slot at most
+# two thirds full instead of a dict entry with two boxed ints.  A key is
+# spread over the slots by the top bits of its product with FIB (Fibonacci
+# hashing), since the keys of the edges of one symbol are runs of node ids.
+# Node ids are below 1 << 31, so no key is EMPTY.  Edges are only ever added.
+EMPTY = -1
+FIB = 0x9e3779b97f4a7c15
+
+class _edgehash:
+    def __init__(self, bits=3):
+        self.keys = array('q', [EMPTY]) * (1 << bits)
+        self.ids = array('i', [0]) * (1 << bits)
+        self.mask = (1 << bits) - 1
+        self.shift = 64 - bits
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def __sizeof__(self):
+        return (object.__sizeof__(self) + sys.getsizeof(self.keys) +
+                sys.getsizeof(self.ids))
+
+    def get(self, h, d=None):
+        keys = self.keys
+        i = (h * FIB & 0xffffffffffffffff) >> self.shift
+        k = keys[i]
+        while k != h:
+            if k == EMPTY:
+                return d
+            i = (i + 1) & self.mask
+            k = keys[i]
+        return self.ids[i]
+
+    def __getitem__(self, h):
+        x = _edgehash.get(self, h)
+        if x == None:
+            raise KeyError(h)
+        return x
+
+    def __contains__(self, h):
+        return _edgehash.get(self, h) != None
+
+    def __setitem__(self, h, x):
+        keys = self.keys
+        i = (h * FIB & 0xffffffffffffffff) >> self.shift
+        k = keys[i]
+        while k != h:
+            if k == EMPTY:
+                keys[i] = h
+                self.n += 1
+                break
+            i = (i + 1) & self.mask
+            k = keys[i]
+        self.ids[i] = x
+        if 3 * self.n > 2 * len(keys):
+            self.__grow()
+
+    def __grow(self):
+        # Rehash into twice the slots.
+        (keys, ids) = (self.keys, self.ids)
+        _edgehash.__init__(self, 65 - self.shift)
+        for i in range(len(keys)):
+            if keys[i] != EMPTY:
+                self[keys[i]] = ids[i]
+
+# The edge hash of a profiled cdawg, counting the edges looked up into
+# counts[name].
+class _probes(_edgehash):
+    def __init__(self, counts):
+        _edgehash.__init__(self)
+        self.counts = counts
+        self.name = 'build_edges'
+
+    def __getitem__(self, h):
+        self.counts[self.name] += 1
+        return _edgehash.__getitem__(self, h)
+
+    def get(self, h, d=None):
+        self.counts[self.name] += 1
+        return _edgehash.get(self, h, d)
+
+# A table whose reads are counted into counts[name].
+class _counted:
+    def __init__(self, a, counts, name):
+        self.a = a
+        self.counts = counts
+        self.name = name
+
+    def __getitem__(self, x):
+        self.counts[self.name] += 1
+        return self.a[x]
+
+    def __setitem__(self, x, v):
+        self.a[x] = v
+
+# Count the calls of f into counts[name].
+def _calls(f, counts, name):
+    def g(*args):
+        counts[name] += 1
+        return f(*args)
+    return g
+
+# Lookup caches of a cdawg made with cache_size, mapping keys to the result of
+# __findend.  Results are key numbers, which stay right when a value is
+# overwritten, so only the keys a cdawg inserts have to be dropped.
 
-    def edge(self, c, (k, p), n):
-        self.to[c] = ((k, p), n)
+# Least recently used first.
+class _lru:
+    def __init__(self, size):
+        self.d = OrderedDict()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, k):
+        j = self.d.get(k)
+        if j == None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.d.move_to_end(k)
+        return j
+
+    def put(self, k, j):
+        self.d[k] = j
+        if len(self.d) > self.size:
+            self.d.popitem(False)
+
+    def pop(self, k):
+        self.d.pop(k, None)
+
+    def clear(self):
+        self.d.clear()
+
+# Least frequently used first, least recently used among equals, in buckets
+# of keys per hit count.
+class _lfu:
+    def __init__(self, size):
+        self.d = {}
+        self.freq = {}
+        self.min = 0
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, k):
+        e = self.d.get(k)
+        if e == None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Move k up a bucket.
+        keys = self.freq[e[1]]
+        del keys[k]
+        if not keys:
+            del self.freq[e[1]]
+            if self.min == e[1]:
+                self.min += 1
+        e[1] += 1
+        self.freq.setdefault(e[1], OrderedDict())[k] = None
+        return e[0]
+
+    def put(self, k, j):
+        if len(self.d) >= self.size:
+            if self.min not in self.freq:
+                self.min = min(self.freq)
+            keys = self.freq[self.min]
+            del self.d[keys.popitem(False)[0]]
+            if not keys:
+                del self.freq[self.min]
+        self.d[k] = [j, 1]
+        self.freq.setdefault(1, OrderedDict())[k] = None
+        self.min = 1
+
+    def pop(self, k):
+        e = self.d.pop(k, None)
+        if e != None:
+            keys = self.freq[e[1]]
+            del keys[k]
+            if not keys:
+                del self.freq[e[1]]
+
+    def clear(self):
+        self.d.clear()
+        self.freq.clear()
+
+CACHES = {'lru': _lru, 'lfu': _lfu}
+
+# Deleted keys stay in the graph until they make up this fraction of the text,
+# when compact builds the graph again over the other keys.
+DEAD = 0.5
+
+# Packed text class
+#
+# A drop-in for the array('i') text w of a cdawg over a small alphabet, such
+# as DNA or protein sequences.  The symbols of the alphabet are numbered and
+# packed into bits bits each, the fewest that number them all and one more
+# code, esc (3 bits for ACGT, 5 for the amino acids), instead of the 32 of an
+# array('i').  esc stands for any other symbol.  Given the positions e of the
+# terminators of the cdawg, start markers and terminators are told from their
+# position; the odd symbol outside the alphabet is kept in the sorted arrays
+# pos and vals.  A symbol never straddles more than two bytes, so reading or
+# writing one takes constant time, or logarithmic for an escaped one.
+class packedtext:
+    def __init__(self, alphabet, e=None):
+        if isinstance(alphabet, str):
+            alphabet = [ord(a) for a in alphabet]
+        self.symbols = array('i', alphabet)
+        self.codes = dict((a, i) for (i, a) in enumerate(self.symbols))
+        if not 0 < len(self.codes) == len(self.symbols) <= 256:
+            raise ValueError('alphabet must be 1 to 256 distinct symbols')
+        self.esc = len(self.symbols)
+        self.bits = self.esc.bit_length()
+        self.mask = (1 << self.bits) - 1
+        self.buf = bytearray(2)
+        self.e = e
+        self.pos = array('q')
+        self.vals = array('i')
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def __sizeof__(self):
+        return (object.__sizeof__(self) + sys.getsizeof(self.buf) +
+                sys.getsizeof(self.pos) + sys.getsizeof(self.vals))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return array('i', map(self.__getitem__,
+                                  range(*i.indices(self.n))))
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError('text index out of range')
+        bit = i * self.bits
+        b = bit >> 3
+        buf = self.buf
+        code = (buf[b] | buf[b + 1] << 8) >> (bit & 7) & self.mask
+        if code != self.esc:
+            return self.symbols[code]
+        e = self.e
+        if e != None:
+            j = bisect_left(e, i)
+            if j < len(e) and e[j] == i:
+                return -2 - j
+            if i == (e[j - 1] + 1 if j else 0):
+                return START
+        return self.vals[bisect_left(self.pos, i)]
+
+    def __setitem__(self, i, a):
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError('text index out of range')
+        bit = i * self.bits
+        b = bit >> 3
+        shift = bit & 7
+        buf = self.buf
+        v = buf[b] | buf[b + 1] << 8
+        if v >> shift & self.mask == self.esc:
+            # Drop the symbol kept aside, if any.
+            x = bisect_left(self.pos, i)
+            if x < len(self.pos) and self.pos[x] == i:
+                del self.pos[x]
+                del self.vals[x]
+        code = self.codes.get(a)
+        if code == None:
+            code = self.esc
+            # Start markers and terminators follow from e.
+            if self.e == None or a >= 0:
+                x = bisect_left(self.pos, i)
+                self.pos.insert(x, i)
+                self.vals.insert(x, a)
+        v = v & ~(self.mask << shift) | code << shift
+        buf[b] = v & 0xff
+        buf[b + 1] = v >> 8
+
+    def __iter__(self):
+        return map(self.__getitem__, range(self.n))
+
+    def append(self, a):
+        self.n += 1
+        # Keep a spare byte past the last symbol for two byte reads.
+        if len(self.buf) < ((self.n * self.bits + 7) >> 3) + 1:
+            self.buf.extend(bytes(len(self.buf)))
+        self[self.n - 1] = a
+
+    def extend(self, symbols):
+        for a in symbols:
+            self.append(a)
+
+    def frombytes(self, b):
+        # Symbols in machine values as array('i').frombytes takes them, a
+        # chunk at a time.
+        b = memoryview(b).cast('B')
+        step = 4 << 16
+        for k in range(0, len(b), step):
+            a = array('i')
+            a.frombytes(b[k:k + step])
+            self.extend(a)
 
 # Cdawg class
+#
+# Nodes are integer ids into the node table (len, suf, efirst, term) and edges
+# are integer ids into the edge table (ek, ep, et, enext), so a state costs a
+# few machine words instead of a Python object.  The out-going edges of a node
+# are chained through efirst/enext, and the edge table is hashed on
+# (first symbol, node) in the _edgehash self.to.  term[n] is the key of a
+# terminator edge out of n, the only one for the nodes that whole keys lead
+# to.  _|_ has no edges: every symbol leads from it to the source, which
+# canonize and check_end_point take for granted.
 class cdawg:
-    def __init__(self):
-        # Create the nodes source, sink and _|_.
-        self.source = node(id='source')
-        self.bt = node(id='root')
+    def __init__(self, stats=False, cache_size=None, policy='lru',
+                 alphabet=None):
+        # The symbols to pack the text over (see packedtext), or a callable
+        # returning an empty text like array('i') to store it in.
+        self.alphabet = alphabet
+        # A cache of lookups in front of __findend, see cache_info.
+        self.cache = None
+        if cache_size:
+            if policy not in CACHES:
+                raise ValueError('unknown cache policy %r' % (policy,))
+            self.cache = CACHES[policy](cache_size)
+        # The counters and latency histograms when profiling, see stats.
+        self.counts = None
+        if stats:
+            self.counts = dict.fromkeys(STATS, 0)
+            self.hist = {'build': [0] * BUCKETS, 'query': [0] * BUCKETS}
+            self.hook = None
+        self.__reset()
+
+    def __reset(self):
+        # Node table.
+        self.len = array('i')
+        self.suf = array('i')
+        self.efirst = array('i')
+        self.term = array('i')
+        # Edge table.
+        self.ek = array('i')
+        self.ep = array('i')
+        self.et = array('i')
+        self.enext = array('i')
+        self.to = _edgehash()
+        if self.counts != None:
+            self.to = _probes(self.counts)
 
-        self.source.suf = self.bt
-        self.source.len = 0
-        self.bt.len = -1
+        # Create the nodes _|_ and source.
+        self.bt = self.__node(-1)
+        self.source = self.__node(0)
+        self.suf[self.source] = self.bt
 
         self.sk = (self.source, 0)
         self.i = 0
         self.j = 0
-        self.e = []
-        self.w = ''
-        self.values = {}
-        self.length = {}
+        # The position of the terminator of every key.
+        self.e = array('i')
+        # The text: every key between the start marker and its terminator, in
+        # a growable buffer of symbols.
+        self.w = self.__text()
+        # Whether the keys are bytes rather than str, fixed by the first key.
+        self.binary = False
+        self.values = []
+        # The sink of every key.
+        self.sinks = array('i')
+        # Deleted keys, and the symbols of w they take up.
+        self.dead = set()
+        self.waste = 0
+        # Occurrence counts per node, computed on demand.
+        self.occ = None
+        self.__step = self.__routines()
 
-    def __update(self, s, (k, p)):
+    def __text(self):
+        # An empty text for w.
+        if self.alphabet == None:
+            return array('i')
+        elif callable(self.alphabet):
+            return self.alphabet()
+        return packedtext(self.alphabet, self.e)
+
+    def __node(self, l, n=None):
+        # Create a node of length l, or a duplicate of node n together with
+        # its out-going edges.
+        r = len(self.len)
+        self.len.append(l)
+        self.suf.append(-1)
+        self.efirst.append(-1)
+        self.term.append(-1)
+        if n != None:
+            self.suf[r] = self.suf[n]
+            x = self.efirst[n]
+            while x != -1:
+                k = self.ek[x]
+                self.__edge(r, self.w[k], (k, self.ep[x]), self.et[x])
+                x = self.enext[x]
+        return r
+
+    def __edge(self, s, c, kp, n):
+        (k, p) = kp
+        # Add the c-edge (s, (k, p), n), replacing any existing one.
+        h = c << 32 | s
+        x = self.to.get(h)
+        if x == None:
+            x = len(self.et)
+            self.ek.append(k)
+            self.ep.append(p)
+            self.et.append(n)
+            self.enext.append(self.efirst[s])
+            self.efirst[s] = x
+            self.to[h] = x
+            if c < START:
+                # A key deleted and added again leaves a terminator for
+                # every copy, of which the newest is the one alive.
+                self.term[s] = max(self.term[s], -2 - c)
+        else:
+            self.ek[x] = k
+            self.ep[x] = p
+            self.et[x] = n
+
+    def __edges(self, s):
+        # Iterate over the out-going edges of s as (c, (k, p), n).
+        x = self.efirst[s]
+        while x != -1:
+            k = self.ek[x]
+            yield (self.w[k], (k, self.ep[x]), self.et[x])
+            x = self.enext[x]
+
+    def __symbols(self, key, head=()):
+        # The symbols head followed by those of key, or None if key is not of
+        # the kind of keys stored.
+        if isinstance(key, str) == self.binary:
+            return None
+        s = array('i', head)
+        if self.binary:
+            s.extend(key)
+        else:
+            s.frombytes(key.encode(UTF32, 'surrogatepass'))
+        return s
+
+    def __string(self, s):
+        # The str or bytes key spelled by the symbols s.
+        if self.binary:
+            return array('B', s).tobytes()
+        return s.tobytes().decode(UTF32, 'surrogatepass')
+
+    def __routines(self):
+        # Make the construction routines, closures over the tables, once per
+        # set of tables rather than once per update: __reset and load call
+        # this again after replacing them.  Returns update(s, kp, end, sink),
+        # which adds symbol w[p] of a key ending at end, with sink its sink,
+        # for the active point (s, (k, p - 1)).
         w = self.w
-        e = self.e
-        j = self.j
-        sink = self.sink
+        to = self.to
+        ek = self.ek
+        ep = self.ep
+        et = self.et
+        len_ = self.len
+        suf = self.suf
+        edge = self.__edge
+        bt = self.bt
+        source = self.source
 
-        def extension(s, (k, p)):
+        def extension(s, kp):
+            (k, p) = kp
             # (s, (k, p)) is a canonical reference pair.
             if k > p:
                 return s
-            return s.to[w[k]][1]
+            return et[to[w[k] << 32 | s]]
 
-        def redirect_edge(s, (k, p), r):
-            (k1, p1) = s.to[w[k]][0]
-            s.edge(w[k1], (k1, k1 + p - k), r)
+        def redirect_edge(s, kp, r):
+            (k, p) = kp
+            k1 = ek[to[w[k] << 32 | s]]
+            edge(s, w[k1], (k1, k1 + p - k), r)
 
-        def split_edge(s, (k, p)):
+        def split_edge(s, kp):
+            (k, p) = kp
             # Let (s, (k1, p1), s1) be the w[k]-edge from s.
-            ((k1, p1), s1) = s.to[w[k]]
-            r = node()
+            x = to[w[k] << 32 | s]
+            (k1, p1, s1) = (ek[x], ep[x], et[x])
+            r = self.__node(len_[s] + p - k + 1)
             # Replace the edge by edges (s, (k1, k1 + p - k), r) and
             # (r, (k1 + p - k + 1, p1), s1).
-            s.edge(w[k1], (k1, k1 + p - k), r)
-            r.edge(w[k1 + p - k + 1], (k1 + p - k + 1, p1), s1)
-            r.len = s.len + p - k + 1
+            edge(s, w[k1], (k1, k1 + p - k), r)
+            edge(r, w[k1 + p - k + 1], (k1 + p - k + 1, p1), s1)
             return r
 
-        def separate_node(s, (k, p)):
+        def separate_node(s, kp):
+            (k, p) = kp
             (s1, k1) = canonize(s, (k, p))
             # Implicit case.
             if k1 <= p:
                 return (s1, k1)
             # Explicit case.
-            if s1.len == s.len + p - k + 1:  # Solid case.
+            if len_[s1] == len_[s] + p - k + 1:  # Solid case.
                 return (s1, k1)
 
             # Non-solid case.
             # Create node r1 as a duplication of s1, together with the out-going
             # edges of s1
-            r1 = node(n=s1)
-            r1.suf = s1.suf
-            s1.suf = r1
-            r1.len = s.len + p - k + 1
+            r1 = self.__node(len_[s] + p - k + 1, s1)
+            if counts != None:
+                counts['duplications'] += 1
+            suf[s1] = r1
             while True:
                 # Replace the w[k]-edge from s to s1 by edge (s, (k, p), r1)
-                s.edge(w[k], (k, p), r1)
-                (s, k) = canonize(s.suf, (k, p - 1))
+                edge(s, w[k], (k, p), r1)
+                (s, k) = canonize(suf[s], (k, p - 1))
                 if (s1, k1) != canonize(s, (k, p)):
                     break
             return (r1, p + 1)
 
-        def check_end_point(s, (k, p), c):
+        def check_end_point(s, kp, c):
+            (k, p) = kp
             if k <= p:  # Implicit case.
-                ((k1, p1), s1) = s.to[w[k]]
+                k1 = ek[to[w[k] << 32 | s]]
                 return c == w[k1 + p - k + 1]
             else:
-                return c in s.to
+                return s == bt or (c << 32 | s) in to
 
-        def canonize(s, (k, p)):
+        def canonize(s, kp):
+            (k, p) = kp
+            if k <= p and s == bt:
+                # The edge (_|_, (k, k), source).
+                (s, k) = (source, k + 1)
             if k > p:
                 return (s, k)
-            ((k1, p1), s1) = s.to[w[k]]
+            x = cto[w[k] << 32 | s]
+            (k1, p1, s1) = (ek[x], ep[x], et[x])
             while p1 - k1 <= p - k:
                 k = k + p1 - k1 + 1
                 s = s1
                 if k <= p:
-                    ((k1, p1), s1) = s.to[w[k]]
+                    x = cto[w[k] << 32 | s]
+                    (k1, p1, s1) = (ek[x], ep[x], et[x])
             return (s, k)
 
-        # (s, (k, p - 1)) is the canonical reference pair for the active point.
-        c = w[p]
-        oldr = None
-        s1 = None
-        while not check_end_point(s, (k, p - 1), c):
-            if k <= p - 1:  # Implicit case.
-                if s1 == extension(s, (k, p - 1)):
-                    redirect_edge(s, (k, p - 1), r)
-                    (s, k) = canonize(s.suf, (k, p - 1))
-                    continue
+        # Profiling counts through wrappers, which cost nothing otherwise.
+        cto = to
+        counts = self.counts
+        if counts != None:
+            cto = _counted(to, counts, 'canonize_steps')
+            suf = _counted(suf, counts, 'suffix_links')
+            redirect_edge = _calls(redirect_edge, counts, 'redirects')
+            split_edge = _calls(split_edge, counts, 'splits')
+
+        def update(s, kp, end, sink):
+            (k, p) = kp
+            # (s, (k, p - 1)) is the canonical reference pair for the active
+            # point.
+            c = w[p]
+            oldr = None
+            s1 = None
+            while not check_end_point(s, (k, p - 1), c):
+                if k <= p - 1:  # Implicit case.
+                    if s1 == extension(s, (k, p - 1)):
+                        redirect_edge(s, (k, p - 1), r)
+                        (s, k) = canonize(suf[s], (k, p - 1))
+                        continue
+                    else:
+                        s1 = extension(s, (k, p - 1))
+                        r = split_edge(s, (k, p - 1))
                 else:
-                    s1 = extension(s, (k, p - 1))
-                    r = split_edge(s, (k, p - 1))
-            else:
-                r = s # Explicit case.
-            r.edge(w[p], (p, e[j]), sink)
+                    r = s # Explicit case.
+                edge(r, w[p], (p, end), sink)
+                if oldr != None:
+                    suf[oldr] = r
+                oldr = r
+                (s, k) = canonize(suf[s], (k, p - 1))
             if oldr != None:
-                oldr.suf = r
-            oldr = r
-            (s, k) = canonize(s.suf, (k, p - 1))
-        if oldr != None:
-            oldr.suf = s
-        return separate_node(s, (k, p))
-
-    def __findend(self, k):
-        #print '__findend:', k
-        def traverse_nodes(n, key, i):
-            #print 'traverse', key, i, n.id
-            for (c, ((k, p), n1)) in n.to.items():
-                if c == key[i]:
-                    if key[i:i+p-k] == self.w[k:p]:
-                        if ord(self.w[p]) >= 256 and len(key) == self.length[self.w[p]]:
-                            return self.w[p]
-                        else:
-                            return traverse_nodes(n1, key, i+p-k+1)
-                    else:
-                        return None
-        return traverse_nodes(self.source, k, 0)
+                suf[oldr] = s
+            return separate_node(s, (k, p))
+
+        return update
+
+    def __update(self):
+        # Update the graph over the text appended to w since i, key by key;
+        # j and sink are those of the key being added.
+        w = self.w
+        e = self.e
+        j = self.j
+        sink = None
+        update = self.__step
+        (s, k) = self.sk
+        i = self.i
+        for p in range(i, len(w)):
+            if p == i:
+                # Create a new sink.
+                sink = self.__node(0)
+                self.sinks.append(sink)
+            (s, k) = update(s, (k, p), e[j], sink)
+            if p == e[j]:
+                i = p + 1
+                j += 1
+        (self.sk, self.i, self.j) = ((s, k), i, j)
+
+    def __findend(self, key, n=None, i=0):
+        # Walk the start marker and key down from the source, or the rest of
+        # key from node n at position i of key, with one edge probe per node,
+        # matching edge labels in place against w.  Returns the number of the
+        # key, or -1.
+        s = self.__symbols(key, (START,))
+        if s == None:
+            return -1
+        w = self.w
+        to = self.to
+        ek = self.ek
+        ep = self.ep
+        et = self.et
+        dead = self.dead
+        l = len(s)
+        if n == None:
+            n = self.source
+        else:
+            i += 1
+        while i < l:
+            x = to.get(s[i] << 32 | n)
+            if x == None:
+                return -1
+            # The first symbol is matched by the probe.
+            k = ek[x] + 1
+            p = ep[x]
+            i += 1
+            while k <= p:
+                if i == l:  # Implicit case.
+                    c = w[k]
+                    j = -2 - c if c < START else -1
+                    return -1 if j in dead else j
+                if w[k] != s[i]:
+                    return -1
+                k += 1
+                i += 1
+            n = et[x]
+        # Explicit case.
+        j = self.term[n]
+        return -1 if j in dead else j
+
+    def __findends(self, keys):
+        # Find the numbers of many keys at once.  The keys of the kind stored
+        # are sorted and their symbols read in one go, so each key resumes
+        # the walk of the one before it from the deepest node on their common
+        # prefix and matches the rest of each label in one comparison.  NumPy
+        # arrays of fixed width keys are sorted by NumPy and their symbols
+        # read from the array itself.  Keys of the other kind are not found,
+        # as in __findend.
+        kind = bytes if self.binary else str
+        if hasattr(keys, 'dtype') and keys.ndim == 1 and \
+           keys.dtype.isnative and \
+           keys.dtype.kind == ('S' if self.binary else 'U'):
+            order = keys.argsort(kind='stable')
+            keys = keys[order]
+            order = order.tolist()
+            width = keys.dtype.itemsize // (1 if self.binary else 4)
+            s = array('i')
+            s.frombytes(keys.view('u1' if self.binary else 'u4')
+                        .astype('i4').tobytes())
+            keys = keys.tolist()
+            ends = [-1] * len(keys)
+            starts = range(0, width * len(keys), width)
+        else:
+            if hasattr(keys, 'dtype'):
+                keys = keys.tolist()
+            else:
+                keys = list(keys)
+            ends = [-1] * len(keys)
+            order = []
+            for (x, key) in enumerate(keys):
+                if isinstance(key, kind):
+                    order.append(x)
+                elif not isinstance(key, (str, bytes)):
+                    ends[x] = self.__findend(key)
+            order.sort(key=keys.__getitem__)
+            keys = [keys[x] for x in order]
+            s = self.__symbols(kind().join(keys))
+            starts = []
+            a = 0
+            for key in keys:
+                starts.append(a)
+                a += len(key)
+        w = self.w
+        to = self.to
+        ek = self.ek
+        ep = self.ep
+        et = self.et
+        term = self.term
+        dead = self.dead
+        x0 = to.get(START << 32 | self.source)
+        if x0 == None:
+            return ends
+        # The nodes reached by the last key, with the symbols of it matched
+        # on the way; the first is the point past the start marker on its
+        # edge from the source.
+        nodes = [None]
+        depths = [0]
+        last = None
+        for (y, key, a) in zip(order, keys, starts):
+            if key == last:
+                ends[y] = j
+                continue
+            i = depths[-1]
+            while i and key[:i] != last[:i]:
+                del nodes[-1]
+                del depths[-1]
+                i = depths[-1]
+            n = nodes[-1]
+            l = len(key)
+            last = key
+            if n == None:
+                x = x0
+                k = ek[x] + 1
+            while True:
+                if n != None:
+                    if i == l:  # Explicit case.
+                        j = term[n]
+                        break
+                    x = to.get(s[a + i] << 32 | n)
+                    if x == None:
+                        j = -1
+                        break
+                    k = ek[x] + 1
+                    i += 1
+                # The rest of the label, up to the end of the key.
+                p = ep[x] + 1
+                m = p - k if p - k < l - i else l - i
+                if m and w[k:k + m] != s[a + i:a + i + m]:
+                    j = -1
+                    break
+                i += m
+                if i == l and k + m < p:  # Implicit case.
+                    c = w[k + m]
+                    j = -2 - c if c < START else -1
+                    break
+                n = et[x]
+                nodes.append(n)
+                depths.append(i)
+            if j in dead:
+                j = -1
+            ends[y] = j
+        return ends
+
+    def __lookup(self, k):
+        # __findend through the cache.
+        if not isinstance(k, (str, bytes)):
+            return self.__findend(k)
+        cache = self.cache
+        j = cache.get(k)
+        if j == None:
+            j = self.__findend(k)
+            cache.put(k, j)
+        return j
+
+    def cache_info(self):
+        # The hits, misses, entries and size of the lookup cache, or None.
+        cache = self.cache
+        if cache == None:
+            return None
+        return {'hits': cache.hits, 'misses': cache.misses,
+                'entries': len(cache.d), 'size': cache.size}
 
     def __contains__(self, k):
-        return self.__findend(k) != None
+        if self.counts != None:
+            t = self.__begin('query', 1)
+        found = (self.__findend(k) if self.cache == None
+                 else self.__lookup(k)) != -1
+        if self.counts != None:
+            self.__end('query', t)
+        return found
+
+    def contains_many(self, keys):
+        # As [key in self for key in keys], for a batch of keys.
+        if self.counts != None:
+            return self.__many(self.contains_many, keys)
+        return [end != -1 for end in self.__findends(keys)]
+
+    def __extend(self, keys):
+        # Append keys to w, each between the start marker and its terminator,
+        # then update the graph over all of the new text in a single pass.
+        if keys and not self.j:
+            self.binary = not isinstance(keys[0], str)
+        for key in keys:
+            if isinstance(key, str) == self.binary:
+                raise TypeError('keys must be all str or all bytes')
+        w = self.w
+        e = self.e
+        self.occ = None
+        if self.cache != None:
+            # Cached misses of the new keys.
+            for key in keys:
+                self.cache.pop(key)
+        for key in keys:
+            w.append(START)
+            if self.binary:
+                w.extend(key)
+            else:
+                w.frombytes(key.encode(UTF32, 'surrogatepass'))
+            e.append(len(w))
+            w.append(-1 - len(e))
+        self.__update()
 
     def __setitem__(self, key, v):
+        if self.counts != None:
+            t = self.__begin('build', 1)
         # Check if the entry already exist.
-        end = self.__findend(key)
-        if end != None:
-            self.values[end] = v
-            return
-        self.e.append(self.i + len(w))
-        # Create a new sink.
-        self.sink = node(id='sink' + str(self.j))
-        self.sink.length = self.e[self.j]
-        # Update new word
-        self.w += key
-        end = unichr(256 + self.j)
-        self.w += end
-        for i in range(self.i, len(self.w)):
-            # Create a new edge (_|_, (-j, -j), source).
-            if self.w[i] not in self.bt.to:
-                self.bt.edge(self.w[i], (i, i), self.source)
-            (s, k) = self.sk
-            self.sk = self.__update(s, (k, i))
-        self.i = len(self.w)
-        self.j += 1
-        self.values[end] = v
-        self.length[end] = len(key)
+        j = self.__findend(key)
+        if j != -1:
+            self.values[j] = v
+        else:
+            self.__extend([key])
+            self.values.append(v)
+        if self.counts != None:
+            self.counts['inserts'] += j == -1
+            self.__end('build', t)
+
+    def update(self, items):
+        # Insert a mapping or an iterable of (key, value) pairs.  Duplicates
+        # are resolved before any text is appended, so the graph is updated
+        # in one pass over the new keys.
+        if hasattr(items, 'keys'):
+            pairs = ((key, items[key]) for key in items.keys())
+        else:
+            pairs = items
+        if self.counts != None:
+            t = self.__begin('build', 0)
+        keys = []
+        batch = {}
+        for (key, v) in pairs:
+            if key not in batch:
+                j = self.__findend(key) if self.j else -1
+                if j != -1:
+                    self.values[j] = v
+                    continue
+                keys.append(key)
+            batch[key] = v
+        self.__extend(keys)
+        for key in keys:
+            self.values.append(batch[key])
+        if self.counts != None:
+            self.counts['lookups'] += len(batch)
+            self.counts['inserts'] += len(keys)
+            self.__end('build', t)
+
+    @classmethod
+    def from_iterable(cls, items, alphabet=None):
+        c = cls(alphabet=alphabet)
+        c.update(items)
+        return c
 
     def __getitem__(self, k):
-        end = self.__findend(k)
-        if end != None:
-            return self.values[end]
+        if self.counts != None:
+            t = self.__begin('query', 1)
+        j = (self.__findend(k) if self.cache == None
+             else self.__lookup(k))
+        if self.counts != None:
+            self.__end('query', t)
+        if j != -1:
+            return self.values[j]
         else: # TODO: Raise error instead?
             return None
 
-    def render(self, outfile):
-        import pygraphviz
-
-        word = self.w
-        root = self.bt
-
-        # Create the graph.
-        graph = pygraphviz.AGraph(strict=False,directed=True)
-        graph.node_attr['fontname'] = 'Sans 12'
-        graph.edge_attr['fontname'] = 'Sans 12'
-        graph.graph_attr['fontname'] = 'Sans 12'
-        graph.add_node(unichr(0x22a5))
-        nodes = ['root']
-        internal_nodes = [root]
-
-        # Replace the label with symbol end marks with something more readable.
-        def translate_label(l):
-            label = ''
-            for c in l:
-                uc = ord(c)
-                if uc < 256:
-                    label += c
-                else:
-                    ucn = uc - 256
-                    ln = ''
-                    while True:
-                        ln = unichr(0x2080 + (ucn % 10)) + ln
-                        ucn /= 10
-                        if ucn == 0:
-                            break
-                    label += '$' + ln
-            return label
-
-        def traverse_nodes(n):
-            root_once = False
-            for (c, ((k, p), n1)) in n.to.items():
-                need_traverse = False
-                # Check if node needs creating.
-                node = n1.id
-                if n1.id not in nodes:
-                    nodes.append(node)
-                    internal_nodes.append(n1)
-                    graph.add_node(node)
-                    need_traverse = True
-                # Get the label.
-                l = word[k:p+1]
-                # Add the edge.
-                if n.id == 'root':
-                    if not root_once:
-                        graph.add_edge(unichr(0x22a5), node, unichr(0x03a3), label=unichr(0x03a3))
-                        root_once = True
-                else:
-                    graph.add_edge(n.id, node, l, label=translate_label(l),
-                                   style='solid')
-                if need_traverse:
-                    traverse_nodes(n1)
-
-        # Recursively create nodes and edges.
-        traverse_nodes(root)
-
-        # Add the suffix links on the graph.
-        for n in internal_nodes:
-            if n.suf:
-                if n.suf.id == 'root':
-                    end = unichr(0x22a5)
+    def get_many(self, keys):
+        # As [self[key] for key in keys], for a batch of keys.
+        if self.counts != None:
+            return self.__many(self.get_many, keys)
+        values = self.values
+        return [values[end] if end != -1 else None
+                for end in self.__findends(keys)]
+
+    def __begin(self, kind, lookups):
+        # Start timing a build or a query of lookups keys.
+        self.counts['lookups'] += lookups
+        self.to.name = kind + '_edges'
+        return time.perf_counter_ns()
+
+    def __end(self, kind, t):
+        # Count the time since t in the histogram of kind, then every so
+        # often pass the numbers to the hook.
+        us = (time.perf_counter_ns() - t) // 1000
+        self.hist[kind][min(us.bit_length(), BUCKETS - 1)] += 1
+        if self.hook != None:
+            self.ops += 1
+            if self.ops >= self.every:
+                self.ops = 0
+                self.hook(self.stats())
+
+    def __many(self, f, keys):
+        # Time a batched query f of keys as a whole, with profiling put off
+        # for the call itself.
+        if not hasattr(keys, 'dtype'):
+            keys = list(keys)
+        t = self.__begin('query', len(keys))
+        (counts, self.counts) = (self.counts, None)
+        try:
+            return f(keys)
+        finally:
+            self.counts = counts
+            self.__end('query', t)
+
+    def stats(self):
+        # The counters of STATS and the build and query latency histograms,
+        # each a list of (microseconds up to, operations), of a cdawg made
+        # with stats=True, else None.
+        if self.counts == None:
+            return None
+        s = dict(self.counts)
+        for (kind, hist) in self.hist.items():
+            s[kind] = [(1 << b, c) for (b, c) in enumerate(hist) if c]
+        return s
+
+    def stats_hook(self, hook, every=1000):
+        # Call hook with stats() after every every builds and queries, to
+        # export them; None removes the hook.
+        self.hook = hook
+        self.every = every
+        self.ops = 0
+
+    def __locus(self, s, head=()):
+        # Walk head and s down from the source.  Returns the node at or below
+        # the end of s, the length of the string spelled on the way there and
+        # the end of the last label, or None if s does not occur in any key.
+        if self.j == 0:
+            return None
+        s = self.__symbols(s, head)
+        if s == None:
+            return None
+        w = self.w
+        to = self.to
+        l = len(s)
+        n = self.source
+        i = 0
+        p = -1
+        while i < l:
+            x = to.get(s[i] << 32 | n)
+            if x == None:
+                return None
+            k = self.ek[x] + 1
+            p = self.ep[x]
+            i += 1
+            while k <= p and i < l:
+                if w[k] != s[i]:
+                    return None
+                k += 1
+                i += 1
+            n = self.et[x]
+            i += p - k + 1
+        return (n, i, p)
+
+    def __counts(self):
+        # The number of paths from each node to a sink, which is the number
+        # of occurrences of the strings the node represents.  An edge always
+        # leads to a longer node or to a sink, so one pass in order of
+        # decreasing length suffices.
+        if self.occ == None:
+            (efirst, enext, et) = (self.efirst, self.enext, self.et)
+            occ = array('q', [1]) * len(self.len)
+            for j in self.dead:
+                occ[self.sinks[j]] = 0
+            for n in sorted(range(len(self.len)), key=self.len.__getitem__,
+                            reverse=True):
+                x = efirst[n]
+                if x != -1:
+                    c = 0
+                    while x != -1:
+                        c += occ[et[x]]
+                        x = enext[x]
+                    occ[n] = c
+            self.occ = occ
+        return self.occ
+
+    def __key(self, j):
+        # Key number j, sliced from the text.
+        start = self.e[j - 1] + 2 if j else 1
+        return self.__string(self.w[start:self.e[j]])
+
+    def has_substring(self, s):
+        locus = self.__locus(s)
+        if locus == None:
+            return False
+        return not self.dead or self.__counts()[locus[0]] > 0
+
+    def count_occurrences(self, s):
+        # The number of times s occurs in the keys.
+        if not len(s):
+            # Every position of a key and its end.
+            return len(self.w) - self.j - (self.waste - len(self.dead))
+        locus = self.__locus(s)
+        if locus == None:
+            return 0
+        return self.__counts()[locus[0]]
+
+    def keys_with_prefix(self, p):
+        # Generate the keys starting with p.  Past the start marker, every
+        # path from the end of p to a sink spells a different key.
+        locus = self.__locus(p, (START,))
+        if locus == None:
+            return
+        w = self.w
+        stack = [(locus[0], locus[2])]
+        while stack:
+            (n, q) = stack.pop()
+            if self.efirst[n] == -1:
+                # A sink, reached through the terminator at q.
+                if -2 - w[q] not in self.dead:
+                    yield self.__key(-2 - w[q])
+                continue
+            for (c, (k, q), t) in self.__edges(n):
+                stack.append((t, q))
+
+    def keys_containing(self, s):
+        # Generate the keys containing s, each once, from the sinks reachable
+        # from the end of s.
+        locus = self.__locus(s)
+        if locus == None:
+            return
+        w = self.w
+        seen = set([locus[0]])
+        stack = [locus]
+        while stack:
+            (n, d, q) = stack.pop()
+            if q != -1 and self.efirst[n] == -1:
+                if -2 - w[q] not in self.dead:
+                    yield self.__key(-2 - w[q])
+                continue
+            for (c, (k, q), t) in self.__edges(n):
+                if t not in seen:
+                    seen.add(t)
+                    stack.append((t, 0, q))
+
+    def __len__(self):
+        return self.j - len(self.dead)
+
+    def __sorted(self, lo, hi):
+        # Generate the keys from lo up to hi, either None for no bound, in
+        # sorted order as (key, number).  Keys are spelled depth first along
+        # the edges in order of first symbol, terminators first, so the
+        # stack is as deep as the edges of one key and path holds its
+        # symbols.
+        x = self.to.get(START << 32 | self.source)
+        if x == None:
+            return
+        (lo, hi) = [b if b == None else self.__symbols(b) for b in (lo, hi)]
+        w = self.w
+        dead = self.dead
+        path = array('i')
+        # Past the start marker.
+        stack = [iter([(START, (self.ek[x] + 1, self.ep[x]), self.et[x])])]
+        depths = [0]
+        while stack:
+            for (c, (k, p), t) in stack[-1]:
+                del path[depths[-1]:]
+                if w[p] < START:
+                    # Into a sink, so the key ends with the label less its
+                    # terminator.
+                    path.extend(w[k:p])
+                    if hi != None and path >= hi:
+                        return
+                    j = -2 - w[p]
+                    if j not in dead and (lo == None or path >= lo):
+                        yield (self.__string(path), j)
+                    continue
+                path.extend(w[k:p + 1])
+                # Every key below starts with path.
+                if hi != None and path >= hi:
+                    return
+                if lo == None or path >= lo[:len(path)]:
+                    stack.append(iter(sorted(self.__edges(t))))
+                    depths.append(len(path))
+                    break
+            else:
+                stack.pop()
+                depths.pop()
+
+    def iterkeys(self):
+        # Generate the keys in sorted order.
+        for (key, j) in self.__sorted(None, None):
+            yield key
+
+    def iteritems(self):
+        # Generate the (key, value) pairs in sorted order of key.
+        for (key, j) in self.__sorted(None, None):
+            yield (key, self.values[j])
+
+    # The dict names for the same, so a cdawg iterates like a mapping rather
+    # than through __getitem__ with integers.
+    def __iter__(self):
+        return self.iterkeys()
+
+    def keys(self):
+        return self.iterkeys()
+
+    def items(self):
+        return self.iteritems()
+
+    def range(self, lo=None, hi=None):
+        # Generate the keys from lo up to but not including hi in sorted
+        # order; None leaves a bound open.
+        for (key, j) in self.__sorted(lo, hi):
+            yield key
+
+    def search_fuzzy(self, query, max_dist):
+        # Generate (key, value, distance) for the keys within Levenshtein
+        # distance max_dist of query, in no particular order.  The keys are
+        # spelled depth first as in __sorted, carrying the row of the edit
+        # distance table for the symbols spelled so far, so a prefix no key
+        # can be saved from cuts off all that follows it at once.  Rows are
+        # capped at max_dist + 1, which makes them the states of a
+        # Levenshtein automaton built as it is used, and the keys found past
+        # a node with a row are remembered, so the other paths into the node
+        # with the same row are not walked again.
+        x = self.to.get(START << 32 | self.source)
+        q = self.__symbols(query)
+        if x == None or q == None:
+            return
+        w = self.w
+        dead = self.dead
+        m = len(q)
+        cap = max_dist + 1
+        delta = {}
+
+        def advance(row, k, p):
+            # The row past the symbols w[k:p], or None once no key can get
+            # within max_dist.
+            for a in w[k:p]:
+                new = delta.get((row, a))
+                if new == None:
+                    r = [min(row[0] + 1, cap)]
+                    for i in range(m):
+                        r.append(min(row[i + 1] + 1, r[i] + 1,
+                                     row[i] + (q[i] != a), cap))
+                    new = delta[(row, a)] = tuple(r) if min(r) < cap else ()
+                if not new:
+                    return None
+                row = new
+            return row
+
+        path = array('i')
+        # The keys found, as (symbols, number, distance), and for every node
+        # and row left, the keys found past it as a slice of out and the
+        # length of path at the node.
+        out = []
+        memo = {}
+        # Frames of (edges, path length, row, node, keys found on entry).
+        stack = [(iter([(START, (self.ek[x] + 1, self.ep[x]), self.et[x])]),
+                  0, tuple(min(i, cap) for i in range(m + 1)), None, 0)]
+        while stack:
+            (edges, depth, row, n, before) = stack[-1]
+            for (c, (k, p), t) in edges:
+                del path[depth:]
+                if w[p] < START:
+                    # Into a sink: the key ends with the label less its
+                    # terminator.
+                    r = advance(row, k, p)
+                    j = -2 - w[p]
+                    if r != None and r[m] <= max_dist and j not in dead:
+                        path.extend(w[k:p])
+                        out.append((array('i', path), j, r[m]))
+                        yield (self.__string(path), self.values[j], r[m])
+                    continue
+                r = advance(row, k, p + 1)
+                if r == None:
+                    continue
+                path.extend(w[k:p + 1])
+                if (t, r) in memo:
+                    # The same keys past t as before, after another prefix.
+                    (a, b, d) = memo[(t, r)]
+                    for (s, j, e) in out[a:b]:
+                        s = path + s[d:]
+                        out.append((s, j, e))
+                        yield (self.__string(s), self.values[j], e)
+                    continue
+                stack.append((self.__edges(t), len(path), r, t, len(out)))
+                break
+            else:
+                stack.pop()
+                if n != None:
+                    memo[(n, row)] = (before, len(out), depth)
+
+    def scan(self, text, chunk_size=1 << 16):
+        # Generate (position, key, value) for every occurrence of a key in
+        # text, a str or bytes, a stream read chunk_size at a time or an
+        # iterable of chunks, in one pass and in order of the end of the
+        # occurrence.  This is Aho-Corasick over the graph: the state is the
+        # locus of the start marker followed by the longest suffix T of the
+        # text read that begins a key, (n,) at node n or (k, p, t) on the
+        # edge to t with w[k] next.  The suffix links of the graph lose the
+        # start marker, so the failure links, to the longest proper suffix
+        # of T that begins a key, and the moves are worked out as the text
+        # needs them and kept for the rest of the scan.
+        x = self.to.get(START << 32 | self.source)
+        if x == None:
+            return
+        w = self.w
+        to = self.to
+        (ek, ep, et) = (self.ek, self.ep, self.et)
+        term = self.term
+        dead = self.dead
+
+        def step(s, c):
+            # The state after s on c without failing, or None.
+            if len(s) == 1:
+                y = to.get(c << 32 | s[0])
+                if y == None:
+                    return None
+                (k, p, t) = (ek[y] + 1, ep[y], et[y])
+            else:
+                (k, p, t) = s
+                if w[k] != c:
+                    return None
+                k += 1
+            return (t,) if k > p else (k, p, t)
+
+        # Every state has its depth, failure link, the key T is or -1, and
+        # the nearest state down its failure links that is a key, or None.
+        info = {}
+        goto = {}
+
+        def state(s, d, f):
+            if len(s) == 1:
+                j = term[s[0]]
+            else:
+                c = w[s[0]]
+                j = -2 - c if c < START else -1
+            (fd, ff, fj, fout) = info[f]
+            info[s] = (d, f, j, f if fj != -1 else fout)
+
+        root = step((self.source,), START)
+        # The empty key is not reported.
+        info[root] = (0, None, -1, None)
+
+        def move(s, c):
+            # The state after s on c, through the failure links of s up to
+            # the first that has a move on c.
+            chain = [s]
+            while chain[-1] != root and (chain[-1], c) not in goto:
+                chain.append(info[chain[-1]][1])
+            below = goto.get((chain[-1], c))
+            if below == None:
+                n = step(root, c)
+                if n != None and n not in info:
+                    state(n, 1, root)
+                below = goto[(root, c)] = n or root
+            for f in reversed(chain[:-1]):
+                n = step(f, c)
+                if n != None:
+                    if n not in info:
+                        state(n, info[f][0] + 1, below)
+                    below = n
+                goto[(f, c)] = below
+            return below
+
+        if isinstance(text, (str, bytes, bytearray, memoryview)):
+            chunks = [text]
+        elif hasattr(text, 'read'):
+            chunks = iter(lambda: text.read(chunk_size), text.read(0))
+        else:
+            chunks = text
+        (s, pos) = (root, 0)
+        for chunk in chunks:
+            symbols = self.__symbols(chunk)
+            if symbols == None:
+                raise TypeError('text must be of the kind of the keys')
+            for c in symbols:
+                s = goto.get((s, c)) or move(s, c)
+                pos += 1
+                (d, f, j, r) = info[s]
+                if j != -1:
+                    r = s
+                while r != None:
+                    (d, f, j, out) = info[r]
+                    if j not in dead:
+                        yield (pos - d, self.__key(j), self.values[j])
+                    r = out
+
+    def matching_statistics(self, text, numpy=False):
+        # The length of the longest prefix of text[i:] that occurs in a key,
+        # for every i, as an array('i'), or a NumPy array with numpy.  The
+        # match is held as a node s, the length ls of the string of s it
+        # spells and o symbols along edge x out of s (x == -1 at s).
+        # Dropping the first symbol of the match keeps s while the string
+        # stays longer than len[suf[s]], the shortest string of s, and
+        # otherwise follows the suffix link and skips down the labels again,
+        # so the whole pass takes time linear in text.  An edge only leading
+        # to dead keys does not match, as in has_substring.
+        t = self.__symbols(text)
+        if t == None:
+            if self.j:
+                raise TypeError('text must be of the kind of the keys')
+            # With no keys yet nothing matches.
+            t = array('i', [START]) * len(text)
+        ms = array('i', [0]) * len(t)
+        w = self.w
+        to = self.to
+        (ek, ep, et) = (self.ek, self.ep, self.et)
+        (len_, suf) = (self.len, self.suf)
+        source = self.source
+        occ = self.__counts() if self.dead else None
+        (s, ls, x, o) = (source, 0, -1, 0)
+        j = 0
+        for i in range(len(t)):
+            # Extend the match of text[i:j] as far as it goes.
+            while j < len(t):
+                c = t[j]
+                if x == -1:
+                    x = to.get(c << 32 | s, -1)
+                    if x == -1:
+                        break
+                    if occ != None and not occ[et[x]]:
+                        x = -1
+                        break
+                elif w[ek[x] + o] != c:
+                    break
+                o += 1
+                j += 1
+                if o == ep[x] - ek[x] + 1:
+                    (s, ls, x, o) = (et[x], ls + o, -1, 0)
+            ms[i] = j - i
+            if j == i:
+                j += 1
+                continue
+            # Drop text[i] from the match.
+            if s == source:
+                (k, m) = (ek[x] + 1, o - 1)
+                (x, o) = (-1, 0)
+            elif ls - 1 > len_[suf[s]]:
+                ls -= 1
+                continue
+            else:
+                (k, m) = (ek[x], o) if x != -1 else (0, 0)
+                (s, ls, x, o) = (suf[s], ls - 1, -1, 0)
+            # Skip down the labels over the m symbols at w[k:].
+            while m:
+                x = to[w[k] << 32 | s]
+                l = ep[x] - ek[x] + 1
+                if l > m:
+                    o = m
+                    break
+                (s, ls, k, m) = (et[x], ls + l, k + l, m - l)
+                x = -1
+        if numpy:
+            import numpy as np
+            return np.frombuffer(ms, dtype=np.intc).copy()
+        return ms
+
+    def longest_common_substring(self, text):
+        # The longest part of text that occurs in a key, the first of them
+        # if there are several.
+        ms = self.matching_statistics(text)
+        if not len(ms):
+            return text[:0]
+        i = max(range(len(ms)), key=ms.__getitem__)
+        return text[i:i + ms[i]]
+
+    def __layout(self):
+        # Lay the graph out as described at frozencdawg.  Returns the sections
+        # and the new id of every node, -1 for _|_.
+        w = self.w
+        efirst = self.efirst
+        renum = array('i', [-1]) * len(self.len)
+        # Number the nodes reachable from the source breadth first.
+        order = [self.source]
+        renum[self.source] = 0
+        for n in order:
+            for (c, (k, p), t) in self.__edges(n):
+                if efirst[t] != -1 and renum[t] == -1:
+                    renum[t] = len(order)
+                    order.append(t)
+        sinks = len(order)
+        root = array('i', [-1, -1, -1])
+        fs = array('i')
+        off = array('i', [0])
+        ek = array('i')
+        ep = array('i')
+        et = array('i')
+        toff = array('i', [0])
+        tkey = array('i')
+        for n in order:
+            for (c, (k, p), t) in sorted(self.__edges(n)):
+                if efirst[t] == -1:
+                    # Sinks follow in key order.
+                    renum[t] = sinks + (-2 - w[p])
+                if c < START:
+                    # A terminator alone.
+                    tkey.append(-2 - c)
+                elif c == START:
+                    root = array('i', [k, p, renum[t]])
                 else:
-                    end = n.suf.id
-                graph.add_edge(n.id, end,
-                               style='dashed')
+                    fs.append(c)
+                    ek.append(k)
+                    ep.append(p)
+                    et.append(renum[t])
+            off.append(len(ek))
+            toff.append(len(tkey))
+        # Start markers and terminators are never compared, so they are
+        # blanked out.
+        text = array('i', w)
+        for j in range(self.j):
+            text[self.e[j - 1] + 1 if j else 0] = 0
+            text[self.e[j]] = 0
+        s = {'w': self.__string(text), 'fs': self.__string(fs), 'root': root,
+             'off': off, 'ek': ek, 'ep': ep, 'et': et, 'toff': toff,
+             'tkey': tkey, 'e': array('i', self.e)}
+        return (s, renum)
 
-        # Layout & draw the graph.
-        graph.layout(prog='dot')
-        graph.draw(outfile)
+    def __delitem__(self, key):
+        j = self.__findend(key)
+        if j == -1:
+            raise KeyError(key)
+        self.__delete(key, j)
 
-if __name__ == '__main__':
-    import sys
+    def pop(self, key, *default):
+        # Delete key and return its value, or default if it is missing.
+        j = self.__findend(key)
+        if j == -1:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        v = self.values[j]
+        self.__delete(key, j)
+        return v
+
+    def __delete(self, key, j):
+        # The key stays in the graph, dead, until the graph is compacted.
+        self.dead.add(j)
+        self.values[j] = None
+        self.waste += self.e[j] - (self.e[j - 1] if j else -1)
+        self.occ = None
+        if self.cache != None:
+            self.cache.pop(key)
+        self.__compact(DEAD)
+
+    def compact(self, threshold=0):
+        self.__compact(threshold)
+
+    def __compact(self, threshold):
+        # Build the graph again over the keys that are alive, in order, if
+        # deleted keys make up at least threshold of the text.  Deleting
+        # compacts at DEAD, so each deletion costs amortized time in the
+        # length of the keys.
+        if not self.dead or self.waste < threshold * len(self.w):
+            return
+        items = self.__items()
+        self.__reset()
+        self.__extend([key for (key, v) in items])
+        self.values = [v for (key, v) in items]
+        if self.cache != None:
+            # Key numbers have changed.
+            self.cache.clear()
 
+    def __items(self):
+        # The keys that are alive and their values, in order.
+        return [(self.__key(j), self.values[j]) for j in range(self.j)
+                if j not in self.dead]
+
+    def freeze(self):
+        # Return a read-only copy of the cdawg for serving queries.
+        if self.dead:
+            return cdawg.from_iterable(self.__items()).freeze()
+        (s, renum) = self.__layout()
+        return frozencdawg(s, list(self.values), self.binary)
+
+    def save(self, path):
+        # Write the cdawg to path in the format read by load.
+        if self.dead:
+            cdawg.from_iterable(self.__items()).save(path)
+            return
+        (s, renum) = self.__layout()
+        nodes = len(s['off']) - 1
+        # Node lengths and suffix links, with _|_ as the id it gets on load.
+        bt = nodes + self.j
+        l = array('i', [0]) * bt
+        suf = array('i', [-1]) * bt
+        for n in range(len(self.len)):
+            if renum[n] != -1:
+                l[renum[n]] = self.len[n]
+                if self.suf[n] == self.bt:
+                    suf[renum[n]] = bt
+                elif self.suf[n] != -1:
+                    suf[renum[n]] = renum[self.suf[n]]
+        blobs = [pickle.dumps(v, pickle.HIGHEST_PROTOCOL) for v in self.values]
+        voff = array('q', [0])
+        for b in blobs:
+            voff.append(voff[-1] + len(b))
+        values = b''.join(blobs)
+        if not self.binary:
+            s['w'] = s['w'].encode(UTF32, 'surrogatepass')
+            s['fs'] = s['fs'].encode(UTF32, 'surrogatepass')
+        (s['len'], s['suf'], s['voff'], s['values']) = (l, suf, voff, values)
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 0x01020304, self.binary, nodes, self.j,
+                                len(s['ek']), len(s['tkey']), len(self.w),
+                                renum[self.sk[0]], self.sk[1], len(values)))
+            for (name, typecode, count) in _layout(0, 0, 0, 0, 0, 0, 0):
+                f.write(b'\0' * (-f.tell() & 7))
+                f.write(s[name])
+
+    @classmethod
+    def load(cls, path, mmap=False, alphabet=None):
+        # Read a cdawg written by save.  With mmap the file is mapped and
+        # queried in place through a frozencdawg, otherwise a cdawg that can
+        # still be extended is rebuilt from it, with its text over alphabet.
+        with open(path, 'rb') as f:
+            if mmap:
+                buf = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+            else:
+                buf = f.read()
+        (h, s) = _sections(buf)
+        binary = bool(h[2])
+        s['w'] = _symbols(s['w'], binary)
+        s['fs'] = _symbols(s['fs'], binary)
+        if mmap:
+            return frozencdawg(s, _pickled(s['voff'], s['values']), binary)
+        (nodes, keys) = h[3:5]
+        (off, toff, e) = (s['off'], s['toff'], s['e'])
+        fs = s['fs']
+        c = cls(alphabet=alphabet)
+        c.binary = binary
+        c.w.extend(s['w'])
+        # The terminators first, which a packed text tells markers by.
+        c.e.frombytes(e.tobytes())
+        for j in range(keys):
+            c.w[e[j - 1] + 1 if j else 0] = START
+            c.w[e[j]] = -2 - j
+        c.values = [pickle.loads(s['values'][s['voff'][j]:s['voff'][j + 1]])
+                    for j in range(keys)]
+        # Node ids are kept, with _|_ after the sinks.
+        c.len = array('i', s['len'].tobytes())
+        c.suf = array('i', s['suf'].tobytes())
+        c.efirst = array('i', [-1]) * len(c.len)
+        c.term = array('i', [-1]) * len(c.len)
+        (c.ek, c.ep, c.et, c.enext, c.to) = (array('i'), array('i'),
+                                             array('i'), array('i'),
+                                             _edgehash())
+        c.source = 0
+        c.bt = c.__node(-1)
+        c.__step = c.__routines()
+        for n in range(nodes):
+            for x in range(off[n], off[n + 1]):
+                c.__edge(n, fs[x], (s['ek'][x], s['ep'][x]), s['et'][x])
+            for x in range(toff[n], toff[n + 1]):
+                j = s['tkey'][x]
+                c.__edge(n, -2 - j, (e[j], e[j]), nodes + j)
+        (k, p, t) = s['root']
+        if k != -1:
+            c.__edge(c.source, START, (k, p), t)
+        c.sk = h[8:10]
+        c.i = len(c.w)
+        c.j = keys
+        c.sinks = array('i', range(nodes, nodes + keys))
+        return c
+
+    def __export(self):
+        # Generate the edges of the graph as (from, to, label), the first
+        # from _|_ to the source, then the suffix links as (from, to, None),
+        # visiting every node once.
+        def name(n):
+            if n == self.bt:
+                return chr(0x22a5)
+            elif n == self.source:
+                return 'source'
+            return 's' + str(n)
+
+        w = self.w
+        yield (chr(0x22a5), 'source', chr(0x03a3))
+        seen = set([self.source])
+        order = [self.source]
+        for n in order:
+            for (c, (k, p), t) in self.__edges(n):
+                yield (name(n), name(t), _label(w[k:p + 1]))
+                if t not in seen:
+                    seen.add(t)
+                    order.append(t)
+        for n in order:
+            if self.suf[n] != -1:
+                yield (name(n), name(self.suf[n]), None)
+
+    def to_edgelist(self):
+        # The edges and then the suffix links as (from, to, label) with node
+        # names, label None for a suffix link.
+        return list(self.__export())
+
+    def to_dot(self, stream):
+        # Write the graph in DOT to a text stream or a path.
+        if isinstance(stream, str):
+            with open(stream, 'w', encoding='utf-8') as f:
+                write_dot(f, self.__export())
+        else:
+            write_dot(stream, self.__export())
+
+    def to_networkx(self):
+        # The graph as a networkx MultiDiGraph, edges labelled with label
+        # and suffix links with style 'dashed'.
+        return export_networkx(self.__export())
+
+    def render(self, outfile):
+        # Write outfile in DOT if it ends in .dot or .gv, otherwise draw it
+        # with pygraphviz in the format of its extension.
+        if outfile.endswith(('.dot', '.gv')):
+            self.to_dot(outfile)
+            return
+        draw(self.__export(), outfile)
+
+# Frozen cdawg class
+#
+# A read-only cdawg for serving queries, made by cdawg.freeze or by mapping a
+# saved file with cdawg.load.  The construction state (active point, suffix
+# links, node lengths, _|_) is gone and nodes are renumbered breadth first from
+# the source (0), followed by one sink per key (sinks + j).  Keys are spelled
+# from the edge of the start marker out of the source, kept apart as root
+# (k, p, target).  The other out-going edges of node n are off[n] to
+# off[n + 1] of the parallel arrays fs (first symbol), ek, ep and et, sorted
+# on first symbol.  Edges made of a terminator alone are kept apart from
+# toff[n] to toff[n + 1] as tkey (the key), and a node that a whole key leads
+# to has just the one.  A terminator otherwise only ends the label of an edge
+# into a sink, which tells the key it belongs to, so start markers and
+# terminators are blanked out of the text w.  w and fs are
+# strings made by freeze, or views of the symbols of a mapped file (bytes or
+# UTF-32 code points) that keys are compared with in place, symbol by symbol.
+class frozencdawg:
+    def __init__(self, s, values, binary):
+        self.w = s['w']
+        self.fs = s['fs']
+        self.mapped = isinstance(self.w, memoryview)
+        self.root = tuple(s['root'])
+        self.off = s['off']
+        self.ek = s['ek']
+        self.ep = s['ep']
+        self.et = s['et']
+        self.toff = s['toff']
+        self.tkey = s['tkey']
+        self.e = s['e']
+        self.sinks = len(self.off) - 1
+        self.values = values
+        self.binary = binary
+        self.occ = None
+
+    def __view(self, key):
+        # key as symbols comparable with those of w, or None if key is not of
+        # the kind of keys stored.
+        if isinstance(key, str) == self.binary:
+            return None
+        if self.mapped and not self.binary:
+            return _symbols(key.encode(UTF32, 'surrogatepass'), False)
+        return key
+
+    def __locus(self, s, prefix=False):
+        # Walk s down from the source, or from past the start marker with
+        # prefix.  Returns the node at or below the end of s and the number of
+        # symbols of the label left before it, or None if s does not occur.
+        s = self.__view(s)
+        (k, p, n) = self.root
+        if s == None or n == -1:
+            return None
+        if prefix:
+            # The label past the start marker.
+            k += 1
+        else:
+            (k, p, n) = (0, -1, 0)
+        w = self.w
+        fs = self.fs
+        off = self.off
+        ek = self.ek
+        ep = self.ep
+        et = self.et
+        sinks = self.sinks
+        l = len(s)
+        i = 0
+        while True:
+            # Only the terminator of key n - sinks can follow the label of an
+            # edge into a sink.
+            end = p if n >= sinks else p + 1
+            m = min(end - k, l - i)
+            if w[k:k + m] != s[i:i + m]:
+                return None
+            i += m
+            if i == l:
+                return (n, end - k - m)
+            if n >= sinks:
+                return None
+            (lo, hi) = (off[n], off[n + 1])
+            x = bisect_left(fs, s[i], lo, hi)
+            if x == hi or fs[x] != s[i]:
+                return None
+            k = ek[x]
+            p = ep[x]
+            n = et[x]
+
+    def __findend(self, key):
+        # Returns the number of the key, or -1.
+        key = self.__view(key)
+        if key == None:
+            return -1
+        w = self.w
+        fs = self.fs
+        off = self.off
+        ek = self.ek
+        ep = self.ep
+        et = self.et
+        sinks = self.sinks
+        (k, p, n) = self.root
+        if n == -1:
+            return -1
+        # The label past the start marker.
+        k += 1
+        m = p - k + 1
+        l = len(key)
+        i = 0
+        while True:
+            if n >= sinks:
+                # Only the terminator of key n - sinks can follow the label.
+                if i + m - 1 != l or w[k:p] != key[i:]:
+                    return -1
+                return n - sinks
+            if i + m > l or w[k:k + m] != key[i:i + m]:
+                return -1
+            i += m
+            if i == l:
+                break
+            (lo, hi) = (off[n], off[n + 1])
+            x = bisect_left(fs, key[i], lo, hi)
+            if x == hi or fs[x] != key[i]:
+                return -1
+            k = ek[x]
+            p = ep[x]
+            m = p - k + 1
+            n = et[x]
+        # Explicit case.
+        x = self.toff[n]
+        if x < self.toff[n + 1]:
+            return self.tkey[x]
+        return -1
+
+    def __below(self, n):
+        # The nodes an edge out of node n leads to.
+        for x in range(self.off[n], self.off[n + 1]):
+            yield self.et[x]
+        for x in range(self.toff[n], self.toff[n + 1]):
+            yield self.sinks + self.tkey[x]
+
+    def __counts(self):
+        # The number of paths from each node to a sink, as at cdawg, summed
+        # over the nodes in reverse topological order.  The source is first
+        # and its start marker edge is kept apart.
+        if self.occ == None:
+            sinks = self.sinks
+            root = self.root[2]
+            indeg = array('i', [0]) * sinks
+            for t in self.et:
+                if t < sinks:
+                    indeg[t] += 1
+            if -1 < root < sinks:
+                indeg[root] += 1
+            order = [0]
+            for n in order:
+                for t in self.__below(n):
+                    if t < sinks:
+                        indeg[t] -= 1
+                        if not indeg[t]:
+                            order.append(t)
+                if n == 0 and -1 < root < sinks:
+                    indeg[root] -= 1
+                    if not indeg[root]:
+                        order.append(root)
+            occ = array('q', [1]) * (sinks + len(self.e))
+            for n in reversed(order):
+                occ[n] = sum(occ[t] for t in self.__below(n))
+            self.occ = occ
+        return self.occ
+
+    def has_substring(self, s):
+        return self.__locus(s) != None
+
+    def count_occurrences(self, s):
+        # The number of times s occurs in the keys.
+        if not len(s):
+            # Every position of a key and its end.
+            return len(self.w) - len(self.e)
+        locus = self.__locus(s)
+        if locus == None:
+            return 0
+        return self.__counts()[locus[0]]
+
+    def keys_with_prefix(self, p):
+        # Generate the keys starting with p, one for every path from the end
+        # of p to a sink.
+        locus = self.__locus(p, True)
+        if locus == None:
+            return
+        stack = [locus[0]]
+        while stack:
+            n = stack.pop()
+            if n >= self.sinks:
+                yield self.__key(n - self.sinks)
+                continue
+            stack.extend(self.__below(n))
+
+    def keys_containing(self, s):
+        # Generate the keys containing s, each once, from the sinks reachable
+        # from the end of s.
+        locus = self.__locus(s)
+        if locus == None:
+            return
+        seen = set([locus[0]])
+        stack = [locus[0]]
+        while stack:
+            n = stack.pop()
+            if n >= self.sinks:
+                yield self.__key(n - self.sinks)
+                continue
+            for t in self.__below(n):
+                if t not in seen:
+                    seen.add(t)
+                    stack.append(t)
+
+    def __contains__(self, k):
+        return self.__findend(k) != -1
+
+    def __getitem__(self, k):
+        j = self.__findend(k)
+        if j != -1:
+            return self.values[j]
+        else:
+            return None
+
+    def __len__(self):
+        return len(self.e)
+
+    def __iter__(self):
+        # Keys in insertion order, sliced from the text.
+        for j in range(len(self.e)):
+            yield self.__key(j)
+
+    def __key(self, j):
+        # Key number j, sliced from the text.
+        e = self.e
+        s = self.w[e[j - 1] + 2 if j else 1:e[j]]
+        if self.mapped:
+            s = s.tobytes()
+            if not self.binary:
+                s = s.decode(UTF32, 'surrogatepass')
+        return s
+
+# Concurrent cdawg class
+#
+# A cdawg for one writer thread and any number of reader threads.  Writes take
+# the lock and are bracketed by two increments of the generation gen, which is
+# therefore odd while the graph is being changed and publishes a new even
+# generation after each insert or update batch.  Readers take no lock: they
+# query the graph as it is and keep the answer if gen was even and unchanged
+# throughout, the answer of a whole generation.  Otherwise, or if the query
+# tripped over a half-made change, it is asked again under the lock.
+# snapshot() is a frozencdawg of the latest generation for readers that need
+# several answers from the same one.  Profiling is not offered, as lock-free
+# readers would share its counters and latency histograms with the writer.
+class concurrentcdawg(cdawg):
+    def __init__(self, stats=False, alphabet=None):
+        if stats:
+            raise ValueError('concurrentcdawg does not support stats')
+        super().__init__(alphabet=alphabet)
+        self.lock = threading.Lock()
+        self.gen = 0
+        self.snap = None
+
+    def __write(self, f, *args):
+        with self.lock:
+            self.gen += 1
+            try:
+                return f(self, *args)
+            finally:
+                self.gen += 1
+
+    def __read(self, f, *args):
+        gen = self.gen
+        if not gen & 1:
+            try:
+                r = f(self, *args)
+            except Exception:
+                pass
+            else:
+                if self.gen == gen:
+                    return r
+        with self.lock:
+            return f(self, *args)
+
+    def __generate(self, f, *args):
+        # Run the generator f on the generation it starts on.  A stream
+        # cannot be read again, so a write while it runs is an error rather
+        # than a retry.
+        with self.lock:
+            gen = self.gen
+        it = f(self, *args)
+        while True:
+            try:
+                r = next(it)
+            except StopIteration:
+                return
+            except Exception:
+                if self.gen != gen:
+                    break
+                raise
+            if self.gen != gen:
+                break
+            yield r
+        raise RuntimeError('concurrentcdawg changed during iteration')
+
+    def __setitem__(self, key, v):
+        self.__write(cdawg.__setitem__, key, v)
+
+    def update(self, items):
+        self.__write(cdawg.update, items)
+
+    def __delitem__(self, key):
+        self.__write(cdawg.__delitem__, key)
+
+    def pop(self, key, *default):
+        return self.__write(cdawg.pop, key, *default)
+
+    def compact(self, threshold=0):
+        self.__write(cdawg.compact, threshold)
+
+    def __contains__(self, k):
+        return self.__read(cdawg.__contains__, k)
+
+    def __getitem__(self, k):
+        return self.__read(cdawg.__getitem__, k)
+
+    def contains_many(self, keys):
+        if not hasattr(keys, 'dtype'):
+            keys = list(keys)
+        return self.__read(cdawg.contains_many, keys)
+
+    def get_many(self, keys):
+        if not hasattr(keys, 'dtype'):
+            keys = list(keys)
+        return self.__read(cdawg.get_many, keys)
+
+    def has_substring(self, s):
+        return self.__read(cdawg.has_substring, s)
+
+    def count_occurrences(self, s):
+        # The counts are cached on the cdawg, so they are never computed from
+        # a half-made change.
+        with self.lock:
+            return cdawg.count_occurrences(self, s)
+
+    def keys_with_prefix(self, p):
+        return iter(self.__read(lambda c, p: list(
+            cdawg.keys_with_prefix(c, p)), p))
+
+    def keys_containing(self, s):
+        return iter(self.__read(lambda c, s: list(
+            cdawg.keys_containing(c, s)), s))
+
+    def iterkeys(self):
+        return iter(self.__read(lambda c: list(cdawg.iterkeys(c))))
+
+    def iteritems(self):
+        return iter(self.__read(lambda c: list(cdawg.iteritems(c))))
+
+    def range(self, lo=None, hi=None):
+        return iter(self.__read(lambda c, lo, hi: list(
+            cdawg.range(c, lo, hi)), lo, hi))
+
+    def search_fuzzy(self, query, max_dist):
+        return iter(self.__read(lambda c, q, d: list(
+            cdawg.search_fuzzy(c, q, d)), query, max_dist))
+
+    def scan(self, text, chunk_size=1 << 16):
+        return self.__generate(cdawg.scan, text, chunk_size)
+
+    def matching_statistics(self, text, numpy=False):
+        # With dead keys it needs the occurrence counts, see
+        # count_occurrences.
+        if self.dead:
+            with self.lock:
+                return cdawg.matching_statistics(self, text, numpy)
+        return self.__read(cdawg.matching_statistics, text, numpy)
+
+    def snapshot(self):
+        # A frozencdawg of the latest generation, shared until the next
+        # write.
+        snap = self.snap
+        if snap == None or snap[0] != self.gen:
+            with self.lock:
+                snap = (self.gen, self.freeze())
+                self.snap = snap
+        return snap[1]
+
+    def save(self, path):
+        with self.lock:
+            cdawg.save(self, path)
+
+if __name__ == '__main__':
     # Concatenate the input words and separate using unique symbols.
     c = cdawg()
     j = 0
@@ -295,9 +2165,7 @@ if __name__ == '__main__':
         j += 1
 
     for w in sys.argv[1:]:
-        print w, c[w]
+        print(w, c[w])
 
     # Draw
     c.render('out.png')
-
-
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""
+PyCDAWG 0.0.0
+Copyright (C) 2011 by Tai Chi Minh Ralph Eastwood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import pickle
+import sys
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+
+from cdawg import cdawg
+
+# A sharded directory holds the routing in INDEX and shard j in SHARD % j.
+INDEX = 'index'
+SHARD = 'shard%d.cdawg'
+
+def _build(pairs, path):
+    # Build one shard in a worker process and write it out; only its path
+    # goes back to the parent.
+    cdawg.from_iterable(pairs).save(path)
+    return path
+
+# Sharded cdawg class
+#
+# Keys are spread over a list of cdawgs, either by a CRC-32 of their UTF-8 or
+# byte encoding, which is the same in every process, or by ranges between
+# sorted bounds.  A key only ever lives in the shard it routes to, so whole key
+# lookups go to a single shard and nothing has to be merged; substring queries
+# ask every shard.
+class shardedcdawg:
+    def __init__(self, shards, bounds=None):
+        self.shards = shards
+        self.bounds = bounds
+
+    def __shard(self, key):
+        # The number of the shard key belongs to.
+        if self.bounds != None:
+            if self.bounds and isinstance(key, str) != isinstance(
+                    self.bounds[0], str):
+                # The shards turn away a key of the other kind anyway.
+                return 0
+            return bisect_right(self.bounds, key)
+        if isinstance(key, str):
+            key = key.encode('utf-8', 'surrogatepass')
+        return zlib.crc32(key) % len(self.shards)
+
+    @classmethod
+    def build(cls, items, path, shards=None, bounds=None, workers=None,
+              mmap=False):
+        # Partition a mapping or an iterable of (key, value) pairs, build
+        # every shard in its own process and write them into the directory
+        # path, then load them back as load does.  Without bounds there are
+        # shards shards, one per CPU by default, else len(bounds) + 1.
+        if bounds != None:
+            bounds = sorted(bounds)
+            shards = len(bounds) + 1
+        elif shards == None:
+            shards = os.cpu_count() or 1
+        route = cls([None] * shards, bounds)
+        if hasattr(items, 'keys'):
+            pairs = ((key, items[key]) for key in items.keys())
+        else:
+            pairs = items
+        parts = [[] for _ in range(shards)]
+        binary = None
+        for (key, v) in pairs:
+            if binary == None:
+                binary = not isinstance(key, str)
+            elif isinstance(key, str) == binary:
+                raise TypeError('keys must be all str or all bytes')
+            parts[route.__shard(key)].append((key, v))
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, INDEX), 'wb') as f:
+            pickle.dump((shards, bounds), f, pickle.HIGHEST_PROTOCOL)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = [pool.submit(_build, parts[j],
+                                os.path.join(path, SHARD % j))
+                    for j in range(shards)]
+            # Free the partitions while the workers run.
+            del parts
+            for f in done:
+                f.result()
+        return cls.load(path, mmap)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        # Read the shards written by build.  With mmap every shard is mapped
+        # and read-only (see cdawg.load).
+        with open(os.path.join(path, INDEX), 'rb') as f:
+            (shards, bounds) = pickle.load(f)
+        return cls([cdawg.load(os.path.join(path, SHARD % j), mmap)
+                    for j in range(shards)], bounds)
+
+    def __contains__(self, k):
+        return k in self.shards[self.__shard(k)]
+
+    def __getitem__(self, k):
+        return self.shards[self.__shard(k)][k]
+
+    def __route(self, keys):
+        # The positions of keys grouped by shard.
+        groups = {}
+        for (i, key) in enumerate(keys):
+            groups.setdefault(self.__shard(key), []).append(i)
+        return groups
+
+    def get_many(self, keys):
+        # As [self[key] for key in keys], with one batch per shard.
+        keys = list(keys)
+        result = [None] * len(keys)
+        for (j, positions) in self.__route(keys).items():
+            shard = self.shards[j]
+            batch = [keys[i] for i in positions]
+            if hasattr(shard, 'get_many'):
+                values = shard.get_many(batch)
+            else:
+                values = [shard[key] for key in batch]
+            for (i, v) in zip(positions, values):
+                result[i] = v
+        return result
+
+    def contains_many(self, keys):
+        # As [key in self for key in keys], with one batch per shard.
+        keys = list(keys)
+        result = [False] * len(keys)
+        for (j, positions) in self.__route(keys).items():
+            shard = self.shards[j]
+            batch = [keys[i] for i in positions]
+            if hasattr(shard, 'contains_many'):
+                found = shard.contains_many(batch)
+            else:
+                found = [key in shard for key in batch]
+            for (i, f) in zip(positions, found):
+                result[i] = f
+        return result
+
+    def has_substring(self, s):
+        return any(shard.has_substring(s) for shard in self.shards)
+
+    def count_occurrences(self, s):
+        # The number of times s occurs in the keys of all shards.
+        return sum(shard.count_occurrences(s) for shard in self.shards)
+
+    def keys_with_prefix(self, p):
+        # Generate the keys starting with p, shard by shard.
+        for shard in self.shards:
+            yield from shard.keys_with_prefix(p)
+
+    def keys_containing(self, s):
+        # Generate the keys containing s, shard by shard.
+        for shard in self.shards:
+            yield from shard.keys_containing(s)
+
+if __name__ == '__main__':
+    # Shard the words on the command line into the directory sys.argv[1].
+    c = shardedcdawg.build(((w, j) for (j, w) in enumerate(sys.argv[2:])),
+                           sys.argv[1])
+    for w in sys.argv[2:]:
+        print(w, c[w])
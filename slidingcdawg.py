@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 """
 PyCDAWG 0.0.0
@@ -23,7 +23,29 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-from copy import copy
+import heapq
+import sys
+from bisect import bisect_left, bisect_right, insort
+
+from cdawg import draw, export_networkx, write_dot
+
+# Replace the label with symbol end marks with something more readable.
+def translate_label(l):
+    label = ''
+    for c in l:
+        uc = ord(c)
+        if uc < 256:
+            label += c
+        else:
+            ucn = uc - 256
+            ln = ''
+            while True:
+                ln = chr(0x2080 + (ucn % 10)) + ln
+                ucn //= 10
+                if ucn == 0:
+                    break
+            label += '$' + ln
+    return label
 
 # Node class.
 class node:
@@ -31,24 +53,31 @@ class node:
     sid_count = 0
 
     def __init__(self, id='', n=None):
+        # left holds the nodes whose suffix link is this node, at most one
+        # for each symbol extending it on the left.
+        self.left = set()
+        self.suf = None
         if n != None and isinstance(n, node):
             self.len = n.len
-            self.suf = n.suf
-            self.to = copy(n.to)
-            # Should ye be copied?
-            self.from_ = copy(n.from_)
-            self.credit = n.credit
+            self.link(n.suf)
+            self.count = n.count
         else:
             self.len = 0
-            self.suf = None
-            self.to = {}
-            self.from_ = []
-            self.credit = False
+            self.count = 0
+        # The latest entry for the node in the queue of slidingcdawg.
+        self.seq = None
+        self.to = {}
+        self.from_ = {}
         if id != '':
             self.id = id
         else:
             self.id = 's' + str(node.sid_count)
             node.sid_count += 1
+        # A copy gets the out-going edges of n, which are new in-edges of
+        # their targets.
+        if n != None and isinstance(n, node):
+            for (c, (kp, n1)) in n.to.items():
+                self.edge(c, kp, n1)
 
     #def __repr__(self):
         #return "(id = %s, len = %s, suffix = %s, edges = %s)" % (self.id, self.len, self.suf, self.to)
@@ -56,60 +85,263 @@ class node:
     def __repr__(self):
         return self.id
 
-    def edge(self, c, (k, p), n):
+    def link(self, n):
+        # Set the suffix link to n, None to drop it.
+        if self.suf != None:
+            self.suf.left.discard(self)
+        self.suf = n
+        if n != None:
+            n.left.add(self)
+
+    def edge(self, c, kp, n):
+        (k, p) = kp
+        # from_ maps (parent, c) to the label of each in-edge; replacing an
+        # edge takes it off the old target.
+        if c in self.to:
+            del self.to[c][1].from_[(self, c)]
         self.to[c] = ((k, p), n)
-        n.from_.append((c, self))
+        n.from_[(self, c)] = (k, p)
+
+    def unedge(self, c):
+        # Remove the c-edge.
+        del self.to[c][1].from_[(self, c)]
+        del self.to[c]
+
+    def redirect(self, n, l=None):
+        # Turn the in-edges of this node to n, only those spelling strings
+        # shorter than l if given, in time linear in the in-degree.
+        for ((s, c), (k, p)) in list(self.from_.items()):
+            if l == None or s.len + p - k + 1 < l:
+                s.edge(c, (k, p), n)
+
+    def fold(self):
+        # Splice out a node left with one out-going edge: every in-edge is
+        # extended by its label, spelled at the same occurrence, straight to
+        # its target.  Linear in the in-degree.
+        (c, ((k, p), n)) = next(iter(self.to.items()))
+        for ((s, c1), (k1, p1)) in list(self.from_.items()):
+            s.edge(c1, (k - (p1 - k1 + 1), p), n)
+        self.unedge(c)
 
 # Cdawg class
+#
+# The graph is the CDAWG of the window, the text [b, i).  Deleting the first
+# character T[0] of the window T only changes the nodes that are prefixes of
+# T, which lie on the path spelling T from the source: each loses the
+# occurrence at 0.  A node x = T[0:j] whose class also holds shorter strings
+# splits, as those keep the occurrence and x[1:] becomes a prefix of the
+# window; the shorter in-edges go to the new node.  The last node before the
+# sink loses its edge along T, unless the active point lies on that edge, in
+# which case the edge is cut back to the active point and the active point
+# moves to its suffix.  A node left with one out-going edge is spliced out
+# (node.fold), and one whose occurrences now all follow the same symbol
+# joins the class of the node that extends it by that symbol, which has its
+# suffix link to x and the same count.  Labels point at text from r on, and
+# are pointed back into the window whenever the text since r fills the ring.
 class slidingcdawg:
-    def __init__(self, debug = False):
+    def __init__(self, debug = False, debug_format = 'png', window = None):
+
+        # Debug mode: render to out_<step>.<debug_format> every debug steps
+        # (characters added or expired), every step for True.
+        self.debug = int(debug)
+        self.debug_format = debug_format
+        self.steps = 0
+
+        # With a window of n characters the text lives in a ring of 2n
+        # slots and the oldest character expires as each new one arrives.
+        self.window = window
+        if window:
+            self.n = 2 * window
+            self.w = [''] * self.n
+        else:
+            self.n = sys.maxsize
+            self.w = []
+        self.e = sys.maxsize
 
-        # Debug mode
-        self.debug = debug
+        # The window is the text [b, i), and labels refer to text from r on.
+        self.b = 0
+        self.r = 0
+        self.i = 0
 
         # Create the nodes source, sink and _|_.
         self.source = node(id='source')
         self.bt = node(id='root')
 
-        self.source.suf = self.bt
+        self.source.link(self.bt)
         self.source.len = 0
         self.bt.len = -1
+        # The empty string occurs at every position.
+        self.source.count = 1
 
-        self.sk = (self.source, 0)
-        self.i = 0
-        self.e = 4294967296
-        self.w = ''
+        self.sk = (self.source, self.b)
 
         # Create a new sink.
         self.sink = node(id='sink')
         self.sink.length = self.e
+        self.sink.count = 1
+
+        # Every node but the source and sink is queued by decreasing length
+        # in longest, as (-len, seq, node); a node merged away leaves its
+        # entry stale, to be dropped as it comes up.  A node occurs at most
+        # as often as its suffix link, so the suffix links lead from the
+        # source to the nodes by decreasing count with no queue to keep.
+        self.longest = []
+        self.nodes = 0
+        self.seq = 0
+
+        # The repeated suffixes of the text: ends holds the nodes they end
+        # at, the source for the empty one, and marks the others by the
+        # (node, c) edge they end inside, as the sorted positions q where
+        # their part on the edge starts, at depth i - q.  arrive lists by
+        # position the edges whose deepest mark reaches the edge target
+        # with the character there, and mheap queues the marks shortest
+        # first as (length - i, seq, q, node, c).
+        self.ends = set([self.source])
+        self.marks = {}
+        self.arrive = {}
+        self.mheap = []
+        self.nmarks = 0
+
+    def __new(self, s):
+        # Queue the new node s.
+        self.nodes += 1
+        self.seq += 1
+        s.seq = self.seq
+        heapq.heappush(self.longest, (-s.len, self.seq, s))
+        if len(self.longest) > 2 * self.nodes + 64:
+            self.longest = [x for x in self.longest if x[2].seq != None]
+            heapq.heapify(self.longest)
+
+    def __mark(self, s, c, q):
+        # Mark the repeated suffix ending inside the c-edge of s from q.
+        m = self.marks.setdefault((s, c), [])
+        j = bisect_left(m, q)
+        if j < len(m) and m[j] == q:
+            return
+        m.insert(j, q)
+        self.nmarks += 1
+        self.seq += 1
+        heapq.heappush(self.mheap, (s.len - q, self.seq, q, s, c))
+        if len(self.mheap) > 2 * self.nmarks + 64:
+            self.mheap = [x for x in self.mheap if self.__rank(*x[3:], x[2])]
+            heapq.heapify(self.mheap)
+        if j == 0:
+            self.__schedule(s, c)
+
+    def __rank(self, s, c, q):
+        # The number of marks on the c-edge of s from q down, or None if
+        # there is none at q.
+        m = self.marks.get((s, c), ())
+        j = bisect_left(m, q)
+        if j < len(m) and m[j] == q:
+            return j + 1
+        return None
+
+    def __unmark(self, s, c, q):
+        m = self.marks[(s, c)]
+        j = bisect_left(m, q)
+        del m[j]
+        self.nmarks -= 1
+        if not m:
+            del self.marks[(s, c)]
+        elif j == 0:
+            self.__schedule(s, c)
+
+    def __unmark_all(self, s, c):
+        # Take every mark off the c-edge of s.
+        m = self.marks.pop((s, c), [])
+        self.nmarks -= len(m)
+        return m
+
+    def __schedule(self, s, c):
+        # Note when the deepest mark on the c-edge of s reaches its target.
+        ((k, p), s1) = s.to[c]
+        if s1 is not self.sink:
+            q = self.marks[(s, c)][0]
+            self.arrive.setdefault(q + p - k, []).append((s, c))
+
+    def __cut(self, s, c, l, r):
+        # The c-edge of s now ends at r after l characters: the marks deeper
+        # go on along the edges of r.
+        m = self.marks.get((s, c))
+        if m:
+            j = bisect_left(m, self.i - l)
+            for q in m[:j]:
+                self.__mark(r, self.w[(q + l) % self.n], q + l)
+            del m[:j]
+            self.nmarks -= j
+            if m:
+                self.__schedule(s, c)
+            else:
+                del self.marks[(s, c)]
 
-    def __extension(self, s, (k, p)):
+    def __refresh(self):
+        # Point every label at an occurrence inside the window, found from
+        # the labels into the sink, which spell suffixes of the window.  end
+        # is the end of an occurrence of the longest string of every node.
+        sink = self.sink
+        end = {}
+        stack = [(self.source, iter(list(self.source.to.items())))]
+        while stack:
+            (s, edges) = stack[-1]
+            for (c, ((k, p), s1)) in edges:
+                if s1 is not sink and s1 not in end:
+                    stack.append((s1, iter(list(s1.to.items()))))
+                    break
+            else:
+                stack.pop()
+                for (c, ((k, p), s1)) in s.to.items():
+                    if s1 is sink:
+                        end[s] = k - 1
+                    else:
+                        q = end[s1]
+                        s.edge(c, (q - p + k, q), s1)
+                        end[s] = q - p + k - 1
+        self.r = self.b
+
+    def __text(self, k, p):
+        # The text at positions [k, p), cut short at the end of the text.
+        p = min(p, self.i)
+        if k >= p:
+            return ''
+        (k1, p1) = (k % self.n, p % self.n)
+        if k1 < p1 or p1 == 0:
+            return ''.join(self.w[k1:p1 or self.n])
+        return ''.join(self.w[k1:]) + ''.join(self.w[:p1])
+
+    def __extension(self, s, kp):
+        (k, p) = kp
         # (s, (k, p)) is a canonical reference pair.
         if k > p:
             return s
-        return s.to[self.w[k]][1]
+        return s.to[self.w[k % self.n]][1]
 
-    def __redirect_edge(self, s, (k, p), r):
-        (k1, p1) = s.to[self.w[k]][0]
-        s.edge(self.w[k1], (k1, k1 + p - k), r)
+    def __redirect_edge(self, s, kp, r):
+        (k, p) = kp
+        (k1, p1) = s.to[self.w[k % self.n]][0]
+        s.edge(self.w[k1 % self.n], (k1, k1 + p - k), r)
+        self.__cut(s, self.w[k1 % self.n], p - k + 1, r)
 
-    def __split_edge(self, s, (k, p)):
+    def __split_edge(self, s, kp):
+        (k, p) = kp
+        w = self.w
+        n = self.n
         # Let (s, (k1, p1), s1) be the w[k]-edge from s.
-        ((k1, p1), s1) = s.to[self.w[k]]
+        ((k1, p1), s1) = s.to[w[k % n]]
         r = node()
         # Replace the edge by edges (s, (k1, k1 + p - k), r) and
         # (r, (k1 + p - k + 1, p1), s1).
-        s.edge(self.w[k1], (k1, k1 + p - k), r)
-        r.edge(self.w[k1 + p - k + 1], (k1 + p - k + 1, p1), s1)
+        s.edge(w[k1 % n], (k1, k1 + p - k), r)
+        r.edge(w[(k1 + p - k + 1) % n], (k1 + p - k + 1, p1), s1)
         r.len = s.len + p - k + 1
-        # The edge we are splitting is where the deletion point is
-        (s2, (k2, p2)) = self.dp
-        if s == s2 and self.w[k] == self.w[k2]:
-            self.dp = (r, (k, r.len))
+        # r is a suffix of the text, the one occurrence not going on to s1.
+        r.count = s1.count + 1
+        self.__new(r)
+        self.__cut(s, w[k1 % n], p - k + 1, r)
         return r
 
-    def __separate_node(self, s, (k, p)):
+    def __separate_node(self, s, kp):
+        (k, p) = kp
         (s1, k1) = self.__canonize(s, (k, p))
         # Implicit case.
         if k1 <= p:
@@ -122,54 +354,51 @@ class slidingcdawg:
         # Create node r1 as a duplication of s1, together with the out-going
         # edges of s1
         r1 = node(n=s1)
-        r1.suf = s1.suf
-        s1.suf = r1
+        s1.link(r1)
         r1.len = s.len + p - k + 1
+        self.__new(r1)
         while True:
             # Replace the w[k]-edge from s to s1 by edge (s, (k, p), r1)
-            s.edge(self.w[k], (k, p), r1)
+            s.edge(self.w[k % self.n], (k, p), r1)
             (s, k) = self.__canonize(s.suf, (k, p - 1))
             if (s1, k1) != self.__canonize(s, (k, p)):
                 break
         return (r1, p + 1)
 
-    def __check_end_point(self, s, (k, p), c):
+    def __check_end_point(self, s, kp, c):
+        (k, p) = kp
         if k <= p:  # Implicit case.
-            ((k1, p1), s1) = s.to[self.w[k]]
-            return c == self.w[k1 + p - k + 1]
+            ((k1, p1), s1) = s.to[self.w[k % self.n]]
+            return c == self.w[(k1 + p - k + 1) % self.n]
         else:
             return c in s.to
 
-    def __canonize(self, s, (k, p)):
+    def __canonize(self, s, kp):
+        (k, p) = kp
         if k > p:
             return (s, k)
-        ((k1, p1), s1) = s.to[self.w[k]]
+        w = self.w
+        n = self.n
+        ((k1, p1), s1) = s.to[w[k % n]]
         while p1 - k1 <= p - k:
             k = k + p1 - k1 + 1
             s = s1
             if k <= p:
-                ((k1, p1), s1) = s.to[self.w[k]]
+                ((k1, p1), s1) = s.to[w[k % n]]
         return (s, k)
 
-    def __update(self, s, (k, p)):
-        w = self.w
-        e = self.e
+    def __update(self, s, kp):
+        (k, p) = kp
         sink = self.sink
 
-        # Deletion point.
-        if len(w) == 1:
-            self.dp = (self.source, (0, 0))
-        else:
-            (s1, (k1, p1)) = self.dp
-            p1 += 1
-            self.dp = (s1, (k1, p1))
-
         # (s, (k, p - 1)) is the canonical reference pair for the active point.
-        c = w[p]
+        c = self.w[p % self.n]
         oldr = None
         s1 = None
         while not self.__check_end_point(s, (k, p - 1), c):
+            # The suffix stops being repeated, as c never followed it.
             if k <= p - 1:  # Implicit case.
+                self.__unmark(s, self.w[k % self.n], k)
                 if s1 == self.__extension(s, (k, p - 1)):
                     self.__redirect_edge(s, (k, p - 1), r)
                     (s, k) = self.__canonize(s.suf, (k, p - 1))
@@ -179,168 +408,392 @@ class slidingcdawg:
                     r = self.__split_edge(s, (k, p - 1))
             else:
                 r = s # Explicit case.
-            r.edge(w[p], (p, self.e), sink)
+                self.ends.discard(s)
+            r.edge(c, (p, self.e), sink)
             if oldr != None:
-                oldr.suf = r
+                oldr.link(r)
             oldr = r
             (s, k) = self.__canonize(s.suf, (k, p - 1))
         if oldr != None:
-            oldr.suf = s
+            oldr.link(s)
         return self.__separate_node(s, (k, p))
 
-    def __find(self, k):
-        def traverse_nodes(n, key, i, nl):
-            for (c, ((k, p), n1)) in n.to.items():
-                if c == key[i]:
-                    nl.append((n, c))
-                    if self.w[k:p].startswith(key[i:i+p-k]):
-                        if len(key) <= i + p - k:
-                            return nl
-                        else:
-                            traverse_nodes(n1, key, i+p-k, nl)
-                    else:
-                        return None
-        return traverse_nodes(self.source, k, 0, [])
+    def __find(self, key):
+        # The (node, character) edges on the path spelling key, or None if
+        # key does not occur in the window.
+        nl = []
+        (n, i) = (self.source, 0)
+        while i < len(key):
+            if key[i] not in n.to:
+                return None
+            ((k, p), n1) = n.to[key[i]]
+            nl.append((n, key[i]))
+            m = min(p, self.i - 1) - k + 1
+            if not key.startswith(self.__text(k, k + min(m, len(key) - i)),
+                                  i):
+                return None
+            (n, i) = (n1, i + m)
+        return nl
 
     def __getitem__(self, s):
         return self.__find(s)
 
-    def add(self, c):
-        # Add a new character
-        self.w += c
+    def __repeat(self, s, cd):
+        # The longest string of node s, or that of the point at depth d on
+        # its c-edge.  The label of any out-going edge of s follows an
+        # occurrence of it.
+        if cd:
+            (c, d) = cd
+            k = s.to[c][0][0]
+            return self.__text(k - s.len, k + d)
+        k = next(iter(s.to.values()))[0][0]
+        return self.__text(k - s.len, k)
+
+    def count(self, s):
+        # Number of occurrences of s in the window: the count of the node at
+        # or below its end, and the repeated suffixes marked between.
+        (r, i) = (self.source, 0)
+        while i < len(s):
+            if s[i] not in r.to:
+                return 0
+            ((k, p), r1) = r.to[s[i]]
+            m = min(p, self.i - 1) - k + 1
+            if not s.startswith(self.__text(k, k + min(m, len(s) - i)), i):
+                return 0
+            if len(s) - i < m:
+                # s ends inside the edge.
+                d = len(s) - i
+                return r1.count + bisect_right(self.marks.get((r, s[i]), ()),
+                                               self.i - d)
+            (r, i) = (r1, i + m)
+        return r.count
+
+    def longest_repeat(self):
+        # The longest string that occurs at least twice in the window: the
+        # longest node or else the longest repeated suffix.
+        longest = self.longest
+        while longest and longest[0][2].seq == None:
+            heapq.heappop(longest)
+        (s, k) = self.sk
+        l = s.len + max(0, self.i - k)
+        if longest and -longest[0][0] > l:
+            return self.__repeat(longest[0][2], None)
+        return self.__text(self.i - l, self.i)
+
+    def top_k_repeats(self, k, min_len = 1):
+        # The k most frequent repeats of at least min_len characters, as
+        # (string, count) pairs; each is the longest string with that set
+        # of occurrences.  The nodes come from the source down the suffix
+        # links, most frequent first, and the marks off mheap, shortest and
+        # so most frequent first, to be queued again.  Successive marks with
+        # the same count share their occurrences and only the last, longest,
+        # is kept.
+        top = []
+        front = [(-s.count, -s.len, s.seq, s) for s in self.source.left]
+        heapq.heapify(front)
+        while front and len(top) < k:
+            s = heapq.heappop(front)[3]
+            if s.len >= min_len:
+                top.append((s.count, s.len, s, None))
+            for s1 in s.left:
+                heapq.heappush(front, (-s1.count, -s1.len, s1.seq, s1))
+        mheap = self.mheap
+        marks = []
+        taken = []
+        done = 0
+        while mheap and done < k:
+            x = heapq.heappop(mheap)
+            (q, s, c) = x[2:]
+            j = self.__rank(s, c, q)
+            if j == None:
+                continue
+            taken.append(x)
+            m = (s.to[c][1].count + j, s.len + self.i - q, s, (c, self.i - q))
+            if marks and marks[-1][0] == m[0]:
+                marks[-1] = m
+                continue
+            if marks and marks[-1][1] >= min_len:
+                done += 1
+                if done == k:
+                    break
+            marks.append(m)
+        for x in taken:
+            heapq.heappush(mheap, x)
+        top += [m for m in marks if m[1] >= min_len]
+        top.sort(key=lambda r: (-r[0], -r[1]))
+        return [(self.__repeat(s, cd), c) for (c, l, s, cd) in top[:k]]
+
+    def __add(self):
+        # Add the character at position i to the graph.
+        c = self.w[self.i % self.n]
         # Create a new edge (_|_, (i, i), source)
         if c not in self.bt.to:
             self.bt.edge(c, (self.i, self.i), self.source)
         (s, k) = self.sk
         self.sk = self.__update(s, (k, self.i))
+        p = self.i
         self.i += 1
-        # If debugging, render after every character.
+        # The repeated suffixes left go on by c: those at a node onto its
+        # c-edge, the marks one deeper.  The nodes reached, by a suffix at
+        # a node over an edge of one character or by a mark at the end of
+        # its edge, and the source occur once more.
+        ends = self.ends
+        self.ends = set([self.source])
+        for s in ends:
+            ((k, p1), s1) = s.to[c]
+            if k == p1:
+                self.ends.add(s1)
+            else:
+                self.__mark(s, c, p)
+        for (s, c1) in self.arrive.pop(p, ()):
+            m = self.marks.get((s, c1))
+            if m:
+                ((k, p1), s1) = s.to[c1]
+                if m[0] + p1 - k == p:
+                    self.__unmark(s, c1, m[0])
+                    self.ends.add(s1)
+        for s in self.ends:
+            s.count += 1
+
+    def add(self, c):
+        # A full window loses its oldest character first.
+        if self.window and self.i - self.b == self.window:
+            self.delete()
+        # Move the labels on before the ring overwrites text they refer to.
+        if self.i - self.r == self.n:
+            self.__refresh()
+        # Add a new character
+        if self.window:
+            self.w[self.i % self.n] = c
+        else:
+            self.w.append(c)
+        self.__add()
+        if self.debug:
+            self.__snapshot(1)
+
+    def feed(self, data):
+        # Add every character of a str, a bytes-like buffer (one character
+        # per byte) or an iterable of either, without add's per-character
+        # checks.
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = str(data, 'latin-1')
+        elif not isinstance(data, str):
+            for chunk in data:
+                self.feed(chunk)
+            return
+        window = self.window
+        n = self.n
+        w = self.w
+        add = self.__add
+        expire = self.__expire
+        q = 0
+        while q < len(data):
+            # Take as much as the ring holds before the labels are moved on.
+            if self.i - self.r == n:
+                self.__refresh()
+            chunk = data[q:q + n - (self.i - self.r)]
+            q += len(chunk)
+            if window:
+                k = self.i % n
+                w[k:k + len(chunk)] = chunk[:n - k]
+                if len(chunk) > n - k:
+                    w[:len(chunk) - (n - k)] = chunk[n - k:]
+                for _ in range(len(chunk)):
+                    if self.i - self.b == window:
+                        expire()
+                    add()
+            else:
+                w.extend(chunk)
+                for _ in range(len(chunk)):
+                    add()
         if self.debug:
-            self.render('out_' + self.w + '.png')
-        print self.dp
+            self.__snapshot(len(data))
+
+    def feed_file(self, path, chunk_size = 1 << 16):
+        # Add the bytes of a file, read into one reusable buffer.
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        with open(path, 'rb') as f:
+            while True:
+                k = f.readinto(buf)
+                if not k:
+                    break
+                self.feed(view[:k])
+
+    async def feed_stream(self, reader, chunk_size = 1 << 16):
+        # Add the bytes of an asyncio stream reader until it is at EOF.
+        while True:
+            data = await reader.read(chunk_size)
+            if not data:
+                break
+            self.feed(data)
 
     def delete(self):
-        # Get the deletion point.
-        (s, (k, p)) = self.dp
-        cp = k
-        #if s == root:
-            #cp += 1
-        # Update the delete point
-        self.dp = self.__canonize(s.suf, (cp, p))
-        # Need to shorten (active point on backbone).
-        if self.sk[1] <= self.i - 1 and self.sk[0] == s and self.w[self.sk[1]] == self.w[k]:
-            # Shorten the path
-            ((k1, p1), s1) = s.to[self.w[k]]
-            s.to[self.w[k]] = ((self.sk[1], p1), s1)
-            # Update the active point
-            if self.sk[0] == self.source:
-                self.sk = (self.source, self.sk[1] + 1)
-            else:
-                self.sk = self.__canonize(self.sk[0].suf, (self.sk[1], self.i - 1))
-        else: # Need to delete an edge.
-            # Delete the offending edge
-            del s.to[self.w[k]]
-            # Out-degree == 1 and parent ain't root
-            if len(s.to) == 1 and s != self.bt:
-                # Get the last edge and delete it
-                (kl, pl), sl = s.to[s.to.keys()[0]]
-                del s.to[s.to.keys()[0]]
-                # Update the length
-                length = sl.len
-                # Update labels and ends
-                for c, n in s.from_:
-                    if self.sk[0] == n:
-                        (kt, pt), st = n.to[c]
-                        self.sk = (n, self.sk[1] - pt - kt + 1)
-                    # FIXME: Somehow redirect?
-                    ((k1, p1), s1) = n.to[c]
-                    n.edge(c, (k1, pl), sl)
-                # Delete this node
-                del s
-            elif len(self.w) == 1:
-                s.to = {}
-            else:
-                print "delete broken...."
+        # Expire the oldest character of the window.
+        if self.b < self.i:
+            self.__expire()
         if self.debug:
-            self.render('out_' + self.w + '_.png')
+            self.__snapshot(1)
 
-    def render(self, outfile):
-        import pygraphviz
-
-        word = self.w
-        root = self.bt
-
-        # Create the graph.
-        graph = pygraphviz.AGraph(strict=False,directed=True)
-        graph.node_attr['fontname'] = 'Sans 12'
-        graph.edge_attr['fontname'] = 'Sans 12'
-        graph.graph_attr['fontname'] = 'Sans 12'
-        graph.add_node(unichr(0x22a5))
-        nodes = ['root']
-        internal_nodes = [root]
-
-        # Replace the label with symbol end marks with something more readable.
-        def translate_label(l):
-            label = ''
-            for c in l:
-                uc = ord(c)
-                if uc < 256:
-                    label += c
-                else:
-                    ucn = uc - 256
-                    ln = ''
-                    while True:
-                        ln = unichr(0x2080 + (ucn % 10)) + ln
-                        ucn /= 10
-                        if ucn == 0:
-                            break
-                    label += '$' + ln
-            return label
-
-        def traverse_nodes(n):
-            root_once = False
+    def __expire(self):
+        # Delete the first character of the window from the graph, as told
+        # at the top of the class.
+        w = self.w
+        n = self.n
+        b = self.b
+        # The nodes on the path of the window, and the last edge, into the
+        # sink.
+        path = []
+        s = self.source
+        while True:
+            c = w[(b + s.len) % n]
+            s1 = s.to[c][1]
+            if s1 is self.sink:
+                break
+            path.append(s1)
+            s = s1
+        self.source.count -= 1
+        for x in path:
+            x.count -= 1
+        # Split off the shorter strings of each class, as duplication does.
+        for x in path:
+            if x.len - 1 > x.suf.len:
+                x1 = node(n=x)
+                x1.len = x.len - 1
+                x1.count = x.count + 1
+                x.link(x1)
+                x.redirect(x1, x.len)
+                self.__new(x1)
+                # The repeated suffixes at or below x are at or below x1
+                # too, in the shorter strings.
+                for c1 in x.to:
+                    for q in self.marks.get((x, c1), ()):
+                        self.__mark(x1, c1, q)
+                if x in self.ends:
+                    self.ends.add(x1)
+        # The edge into the sink.  The active point, the longest repeated
+        # suffix, was repeated only here if it lies on it.
+        (s1, k) = self.sk
+        if s1 is s and k < self.i and w[k % n] == c:
+            self.__unmark(s, c, k)
+            s.edge(c, (k, self.e), self.sink)
+            self.sk = self.__canonize(s.suf, (k, self.i - 1))
+        else:
+            s.unedge(c)
+        # Merge the classes that stopped being nodes.
+        for x in reversed(path):
+            if len(x.to) == 1:
+                # An active point at x moves up onto an in-edge.
+                (s1, k) = self.sk
+                if s1 is x:
+                    ((u, c1), (k1, p1)) = next(iter(x.from_.items()))
+                    self.sk = (u, k - (p1 - k1 + 1))
+                # The repeated suffixes at or below x move onto every
+                # in-edge, each holding some of the strings of x.
+                c = next(iter(x.to))
+                m = self.__unmark_all(x, c)
+                if x in self.ends:
+                    m.append(self.i)
+                into = [(u, c1, p1 - k1 + 1)
+                        for ((u, c1), (k1, p1)) in x.from_.items()]
+                x.fold()
+                self.__drop(x)
+                for (u, c1, l) in into:
+                    for q in m:
+                        self.__mark(u, c1, q - l)
+                    if (u, c1) in self.marks:
+                        self.__schedule(u, c1)
+                continue
+            # y, one symbol longer, shares the targets of x off the path,
+            # found among the in-edges of one of them or, for the sink, by
+            # the suffix of the window that the edge label spells.
+            c = w[(b + x.len) % n]
+            y = None
+            for (c1, ((k, p), t)) in x.to.items():
+                if c1 == c:
+                    continue
+                if t is not self.sink:
+                    y = next((y for (y, c2) in t.from_
+                              if c2 == c1 and y.suf is x), None)
+                    break
+                if k - x.len > b + 1:
+                    (y, k1) = self.__canonize(self.source,
+                                              (k - x.len - 1, k - 1))
+                    if k1 < k:
+                        y = None
+                break
+            if y != None and y.suf is x and y.count == x.count:
+                x.redirect(y)
+                y.link(x.suf)
+                for c in list(x.to):
+                    for q in self.__unmark_all(x, c):
+                        self.__mark(y, c, q)
+                    x.unedge(c)
+                if x in self.ends:
+                    self.ends.add(y)
+                self.__drop(x)
+        self.b += 1
+
+    def __drop(self, x):
+        # Forget the node x, merged away.
+        x.seq = None
+        self.nodes -= 1
+        x.link(None)
+        self.ends.discard(x)
+
+    def __snapshot(self, steps):
+        # Render once if the last steps crossed a multiple of debug.
+        before = self.steps
+        self.steps += steps
+        if self.steps // self.debug != before // self.debug:
+            self.render('out_%d.%s' % (self.steps, self.debug_format))
+
+    def __export(self):
+        # Generate the edges of the graph over the window as (from, to,
+        # label), the edges of _|_ drawn as one, then the suffix links as
+        # (from, to, None), visiting every node once.
+
+        def name(n):
+            return chr(0x22a5) if n is self.bt else n.id
+
+        yield (chr(0x22a5), 'source', chr(0x03a3))
+        seen = set([self.source])
+        order = [self.source]
+        for n in order:
             for (c, ((k, p), n1)) in n.to.items():
-                need_traverse = False
-                # Check if node needs creating.
-                node = n1.id
-                if n1.id not in nodes:
-                    nodes.append(node)
-                    internal_nodes.append(n1)
-                    graph.add_node(node)
-                    need_traverse = True
-                # Get the label.
-                l = word[k:p+1]
-                # Add the edge.
-                if n.id == 'root':
-                    if not root_once:
-                        graph.add_edge(unichr(0x22a5), node, unichr(0x03a3), label=unichr(0x03a3))
-                        root_once = True
-                else:
-                    graph.add_edge(n.id, node, l, label=translate_label(l),
-                                   style='solid')
-                if need_traverse:
-                    traverse_nodes(n1)
-
-        # Recursively create nodes and edges.
-        traverse_nodes(root)
-
-        # Add the suffix links on the graph.
-        for n in internal_nodes:
+                yield (n.id, n1.id, translate_label(self.__text(k, p + 1)))
+                if n1 not in seen:
+                    seen.add(n1)
+                    order.append(n1)
+        for n in order:
             if n.suf:
-                if n.suf.id == 'root':
-                    end = unichr(0x22a5)
-                else:
-                    end = n.suf.id
-                graph.add_edge(n.id, end,
-                               style='dashed')
+                yield (n.id, name(n.suf), None)
+
+    def to_edgelist(self):
+        # The edges and then the suffix links as (from, to, label) with node
+        # ids, label None for a suffix link.
+        return list(self.__export())
+
+    def to_dot(self, stream):
+        # Write the graph in DOT to a text stream or a path.
+        if isinstance(stream, str):
+            with open(stream, 'w', encoding='utf-8') as f:
+                write_dot(f, self.__export())
+        else:
+            write_dot(stream, self.__export())
 
-        # Layout & draw the graph.
-        graph.layout(prog='dot')
-        graph.draw(outfile)
+    def to_networkx(self):
+        return export_networkx(self.__export())
 
-if __name__ == '__main__':
-    import sys
+    def render(self, outfile):
+        # Write outfile in DOT if it ends in .dot or .gv, otherwise draw it
+        # with pygraphviz in the format of its extension.
+        if outfile.endswith(('.dot', '.gv')):
+            self.to_dot(outfile)
+            return
+        draw(self.__export(), outfile)
 
+if __name__ == '__main__':
     # Concatenate the input words and separate using unique symbols.
     c = slidingcdawg(debug=True)
     for w in sys.argv[1]: